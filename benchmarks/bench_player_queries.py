@@ -0,0 +1,81 @@
+"""Compare interpolated SQL against the parameterized `Database` queries.
+
+Needs a Postgres server, run with
+`DATABASE_URL=postgresql://... uv run benchmarks/bench_player_queries.py [lookups]`.
+The queries run against a temporary `players` table that shadows the real
+one for the benchmark's single connection, so no data is touched.
+"""
+
+import asyncio
+import os
+import random
+import sys
+import time
+
+import asyncpg
+from common import report
+
+from db.db import Database
+from db.schema import CREATE_PLAYERS_TABLE
+
+ROWS = 20_000
+
+
+async def setup_connection(conn: asyncpg.Connection) -> None:
+    await conn.execute(CREATE_PLAYERS_TABLE.replace("TABLE", "TEMP TABLE", 1))
+    await conn.execute(
+        """
+        INSERT INTO players (discord_id, osu_id)
+        SELECT i, CASE WHEN i % 2 = 0 THEN i + 1000000 END
+        FROM generate_series(1, $1) AS i;
+        """,
+        ROWS,
+    )
+
+
+async def main() -> None:
+    lookups = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000
+    dsn = os.environ.get("DATABASE_URL")
+    if not dsn:
+        raise SystemExit("DATABASE_URL is required")
+
+    db = Database()
+    db.pool = await asyncpg.create_pool(
+        dsn, min_size=1, max_size=1, init=setup_connection
+    )
+    # PlayerRegistry reloads the few players named in each NOTIFY payload
+    rng = random.Random(0)
+    batches = [
+        rng.sample(range(1, ROWS + 1), k=rng.randint(1, 5)) for _ in range(lookups)
+    ]
+
+    async def interpolated() -> None:
+        for batch in batches:
+            await db.pool.fetch(
+                f"SELECT discord_id, osu_id, last_checked FROM players WHERE discord_id IN ({','.join(map(str, batch))});"
+            )
+
+    async def parameterized() -> None:
+        for batch in batches:
+            await db.get_players(batch)
+
+    async def best(fn) -> float:  # type: ignore[no-untyped-def]
+        result = float("inf")
+        for _ in range(3):
+            start = time.perf_counter()
+            await fn()
+            result = min(result, time.perf_counter() - start)
+        return result
+
+    try:
+        report(
+            f"changed player reloads, {lookups} queries",
+            await best(interpolated),
+            await best(parameterized),
+        )
+    finally:
+        await db.pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
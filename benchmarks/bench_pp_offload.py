@@ -0,0 +1,117 @@
+"""Measure event loop lag while pp calculations run inline vs offloaded.
+
+A ticker coroutine sleeps 5 ms in a loop and records how late it wakes up,
+which is what the Discord gateway heartbeat would experience.
+
+Run with `uv run benchmarks/bench_pp_offload.py [path/to/map.osu]`. Without
+a path a synthetic marathon map is generated.
+"""
+
+import asyncio
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from common import SRC_DIR  # noqa: F401  (puts src/ on the import path)
+
+from beatmaps import BeatmapStore
+from pp import PpCalculator, PpJob, calculate, normalize_mods
+
+JOBS = 8
+MODS = [(), ("HD",), ("DT",), ("HD", "DT"), ("HR",), ("HD", "HR"), ("EZ",), ("FL",)]
+TICK = 0.005
+
+
+def synthetic_map(objects: int = 20_000) -> str:
+    lines = [
+        "osu file format v14",
+        "",
+        "[General]",
+        "Mode: 0",
+        "",
+        "[Difficulty]",
+        "HPDrainRate:5",
+        "CircleSize:4",
+        "OverallDifficulty:9",
+        "ApproachRate:9.5",
+        "SliderMultiplier:1.8",
+        "SliderTickRate:1",
+        "",
+        "[TimingPoints]",
+        "0,300,4,2,0,100,1,0",
+        "",
+        "[HitObjects]",
+    ]
+    for i in range(objects):
+        x, y, t = (i * 73) % 512, (i * 151) % 384, 1000 + i * 150
+        if i % 4 == 0:
+            lines.append(f"{x},{y},{t},2,0,L|{(x + 80) % 512}:{y},1,140")
+        else:
+            lines.append(f"{x},{y},{t},1,0,0:0:0:0:")
+    return "\n".join(lines)
+
+
+async def measure(work) -> tuple[float, float]:
+    lags: list[float] = []
+    done = False
+
+    async def ticker() -> None:
+        while not done:
+            start = time.perf_counter()
+            await asyncio.sleep(TICK)
+            lags.append(time.perf_counter() - start - TICK)
+
+    tick_task = asyncio.create_task(ticker())
+    await asyncio.sleep(TICK * 2)
+    start = time.perf_counter()
+    await work()
+    elapsed = time.perf_counter() - start
+    done = True
+    await tick_task
+    return elapsed, max(lags)
+
+
+async def main() -> None:
+    directory = Path(tempfile.mkdtemp())
+    try:
+        if len(sys.argv) > 1:
+            shutil.copy(sys.argv[1], directory / "1.osu")
+        else:
+            (directory / "1.osu").write_text(synthetic_map())
+        # the file exists, so the store never needs an HTTP session
+        store = BeatmapStore(None, directory, max_bytes=1 << 30, cache_size=8)  # type: ignore[arg-type]
+
+        async def inline() -> None:
+            for mods in MODS[:JOBS]:
+                beatmap = store._parse(directory / "1.osu")
+                calculate(beatmap, normalize_mods(mods))
+                await asyncio.sleep(0)
+
+        elapsed, lag = await measure(inline)
+        print(
+            f"inline:          {elapsed:.2f} s total, max loop lag {lag * 1000:.1f} ms"
+        )
+
+        for executor in ("thread", "process"):
+            calculator = PpCalculator(store, executor, workers=2)
+            # warm up worker processes so startup isn't counted
+            await calculator.calculate(1)
+
+            async def offloaded() -> None:
+                await calculator.calculate_many(
+                    [PpJob(1, mods) for mods in MODS[:JOBS]]
+                )
+
+            elapsed, lag = await measure(offloaded)
+            calculator.close()
+            print(
+                f"{executor + ' pool:':<16} {elapsed:.2f} s total, max loop lag {lag * 1000:.1f} ms"
+            )
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,58 @@
+"""Compare list scans against dict indexes for the refresh_roles row lookup.
+
+Run with `uv run benchmarks/bench_rank_index.py [rows]`.
+"""
+
+import random
+import sys
+from types import SimpleNamespace
+
+from common import report, timeit
+
+from reconcile import UNRANKED, build_rank_index, index_by_id
+
+RANKING_SIZE = 1000
+
+
+def main() -> None:
+    rows_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    rng = random.Random(0)
+
+    osu_ids = rng.sample(range(1, 40_000_000), rows_count)
+    ranking = [
+        SimpleNamespace(user=SimpleNamespace(id=osu_id))
+        for osu_id in rng.sample(osu_ids, min(RANKING_SIZE, rows_count))
+    ]
+    members = [SimpleNamespace(id=discord_id) for discord_id in range(rows_count)]
+    rows = list(zip(range(rows_count), osu_ids, strict=True))
+    rng.shuffle(rows)
+
+    def list_scans() -> None:
+        ranking_id_list = [x.user.id for x in ranking]
+        member_id_list = [x.id for x in members]
+        for row in rows:
+            if row[0] not in member_id_list:
+                continue
+            try:
+                ranking_id_list.index(row[1]) + 1
+            except ValueError:
+                pass
+            next(m for m in members if m.id == row[0])
+
+    def dict_lookups() -> None:
+        rank_index = build_rank_index(ranking)  # type: ignore[arg-type]
+        member_index = index_by_id(members)
+        for row in rows:
+            if member_index.get(row[0]) is None:
+                continue
+            rank_index.get(row[1], UNRANKED)
+
+    report(
+        f"refresh_roles lookups, {rows_count} rows",
+        timeit(list_scans, repeat=1),
+        timeit(dict_lookups),
+    )
+
+
+if __name__ == "__main__":
+    main()
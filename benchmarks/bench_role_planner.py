@@ -0,0 +1,59 @@
+"""Time plan_role_changes on a synthetic guild.
+
+Run with `uv run benchmarks/bench_role_planner.py [members]`.
+"""
+
+import random
+import sys
+from collections import Counter
+from types import SimpleNamespace
+
+from common import timeit
+
+from config import ROLE_TRESHOLDS
+from reconcile import UNRANKED, plan_role_changes, role_for_rank
+
+RANKING_SIZE = 1000
+RANK_ROLES = [*ROLE_TRESHOLDS, "LVinf", "restricted"]
+
+
+def main() -> None:
+    members_count = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    rng = random.Random(0)
+
+    discord_ids = list(range(members_count))
+    # roughly a third of the guild has linked an osu! account
+    linked = rng.sample(discord_ids, members_count // 3)
+    players = [(discord_id, 1_000_000 + discord_id) for discord_id in linked]
+
+    ranked = rng.sample(players, min(RANKING_SIZE, len(players)))
+    rank_index = {osu_id: rank for rank, (_, osu_id) in enumerate(ranked, start=1)}
+
+    member_roles: dict[int, list[str]] = {discord_id: [] for discord_id in discord_ids}
+    for discord_id, osu_id in players:
+        rank = rank_index.get(osu_id)
+        # most members already hold the right role, a few drifted
+        roll = rng.random()
+        if roll < 0.95:
+            member_roles[discord_id] = [role_for_rank(rank or UNRANKED)]
+        elif roll < 0.98:
+            member_roles[discord_id] = [rng.choice(RANK_ROLES)]
+
+    active = SimpleNamespace(statistics=SimpleNamespace(is_ranked=True))
+    unranked_users = {
+        osu_id: active for _, osu_id in players if osu_id not in rank_index
+    }
+
+    plan = plan_role_changes(rank_index, players, member_roles, unranked_users)  # type: ignore[arg-type]
+    elapsed = timeit(
+        lambda: plan_role_changes(rank_index, players, member_roles, unranked_users)  # type: ignore[arg-type]
+    )
+    kinds = Counter(transition.notikums for transition in plan)
+    print(
+        f"planned {len(plan)} of {len(players)} linked players "
+        f"({members_count} members) in {elapsed * 1000:.2f} ms: {dict(kinds)}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""Shared setup for the standalone benchmark scripts.
+
+Benchmarks import modules from `src/` the same way `src/app.py` does, so
+`src/` is put on the import path and the required config variables get
+placeholder values (nothing here talks to Discord or the osu! API).
+"""
+
+import os
+import sys
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+sys.path.insert(0, str(SRC_DIR))
+
+for name, value in {
+    "DISCORD_TOKEN": "benchmark",
+    "SERVER_ID": "1",
+    "BOT_CHANNEL_ID": "1",
+    "API_CLIENT_ID": "1",
+    "API_CLIENT_SECRET": "benchmark",
+}.items():
+    os.environ.setdefault(name, value)
+
+
+def timeit(fn: Callable[[], object], repeat: int = 5) -> float:
+    """Return the best wall time of `repeat` runs of `fn` in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def report(name: str, before: float, after: float) -> None:
+    print(
+        f"{name}: before {before * 1000:.2f} ms, after {after * 1000:.2f} ms, "
+        f"speedup {before / after:.1f}x"
+    )
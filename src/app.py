@@ -1,21 +1,45 @@
-import sys
+# installs the import profiler when STARTUP_PROFILE is set, keep it first
+import profiling
 import asyncio
-import queue
+import time
+from pathlib import Path
 import discord
 from discord.ext import commands
 from ossapi import OssapiAsync
 from db.db import Database
 import aiohttp
 from loguru import logger
-from config import API_CLIENT_ID, API_CLIENT_SECRET, BOT_CHANNEL_ID
+from beatmaps import BeatmapStore
+from dispatch import ChannelDispatcher
+from logsink import DiscordLogSink
+from startup import StartupSteps, command_tree_fingerprint
+from osu_api import OsuApi
+from players import PlayerRegistry
+from pp import DifficultyCache, PpCalculator
+from ranking import RankingSnapshot
+from config import (
+    API_CLIENT_ID,
+    API_CLIENT_SECRET,
+    BEATMAP_CACHE_SIZE,
+    BEATMAP_DIR,
+    BEATMAP_DIR_MAX_MB,
+    BOT_CHANNEL_ID,
+    DATABASE_URL,
+    DIFFICULTY_CACHE_SIZE,
+    OSU_API_REQUESTS_PER_MINUTE,
+    OSU_USER_CACHE_TTL,
+    PLAYERS_NOTIFY,
+    PP_EXECUTOR,
+    PP_WORKERS,
+)
 
 from config import DISCORD_TOKEN, SERVER_ID
 
-# Queue for Discord log messages
-_discord_log_queue: queue.Queue[str] = queue.Queue()
+# Buffer for Discord log messages
+_discord_log_sink = DiscordLogSink()
 
 logger.add(
-    lambda msg: _discord_log_queue.put_nowait(msg),
+    _discord_log_sink,
     level="WARNING",  # Only WARNING and above
     diagnose=False,
     backtrace=False,
@@ -24,10 +48,19 @@ logger.add(
 
 
 class OsuBot(commands.Bot):
-    osuapi: OssapiAsync
+    osuapi: OsuApi
     db: Database
+    players: PlayerRegistry
+    # latest country ranking fetched by refresh_roles
+    ranking: RankingSnapshot | None
     lvguild: discord.Guild
     session: aiohttp.ClientSession
+    dispatcher: ChannelDispatcher
+    beatmaps: BeatmapStore
+    pp: PpCalculator
+    startup: StartupSteps
+    # hash of the guild command tree, computed once the cogs are loaded
+    command_fingerprint: str
     _on_ready_finished: bool
     _log_task: asyncio.Task[None] | None
 
@@ -36,8 +69,18 @@ class OsuBot(commands.Bot):
         intents.members = True
         intents.presences = True
 
-        self.osuapi = OssapiAsync(API_CLIENT_ID, API_CLIENT_SECRET)
+        # all osu! API calls share one rate limit, see osu_api.py
+        self.osuapi = OsuApi(
+            OssapiAsync(API_CLIENT_ID, API_CLIENT_SECRET),
+            OSU_API_REQUESTS_PER_MINUTE,
+            user_cache_ttl=OSU_USER_CACHE_TTL,
+        )
         self.db = Database()
+        self.players = PlayerRegistry(self.db)
+        self.ranking = None
+        # outgoing channel messages of cogs, see dispatch.py
+        self.dispatcher = ChannelDispatcher(self)
+        self.startup = StartupSteps()
         self._on_ready_finished = False
         self._log_task = None
 
@@ -45,6 +88,18 @@ class OsuBot(commands.Bot):
 
     async def setup_hook(self) -> None:
         self.session = aiohttp.ClientSession()
+        self.beatmaps = BeatmapStore(
+            self.session,
+            Path(BEATMAP_DIR),
+            max_bytes=BEATMAP_DIR_MAX_MB * 1024 * 1024,
+            cache_size=BEATMAP_CACHE_SIZE,
+        )
+        self.pp = PpCalculator(
+            self.beatmaps,
+            PP_EXECUTOR,
+            PP_WORKERS,
+            cache=DifficultyCache(self.db, DIFFICULTY_CACHE_SIZE),
+        )
         try:
             await self.db.setup_hook()
         except Exception as e:
@@ -56,12 +111,31 @@ class OsuBot(commands.Bot):
                 # Re-raise so the process exits with a non-zero status
                 raise
 
+        await self.players.load()
+        if PLAYERS_NOTIFY:
+            await self.players.listen(DATABASE_URL)
+
         # Load extensions - app commands are automatically registered when cogs are loaded
-        await self.load_extension("cogs.events")
-        await self.load_extension("cogs.commands")
-        await self.load_extension("cogs.link_user")
-        await self.load_extension("cogs.roles")
-        await self.load_extension("cogs.user_newbest")
+        for extension in (
+            "cogs.events",
+            "cogs.commands",
+            "cogs.link_user",
+            "cogs.roles",
+            "cogs.user_newbest",
+        ):
+            start = time.perf_counter()
+            await self.load_extension(extension)
+            if profiling.STARTUP_PROFILE:
+                logger.info(
+                    f"loaded {extension} in {(time.perf_counter() - start) * 1000:.1f} ms"
+                )
+        if profiling.import_profiler is not None:
+            profiling.import_profiler.report()
+            profiling.import_profiler.uninstall()
+
+        self.command_fingerprint = command_tree_fingerprint(
+            self.tree, discord.Object(id=SERVER_ID)
+        )
 
     async def on_ready(self) -> None:
         guildstring = ""
@@ -72,12 +146,50 @@ class OsuBot(commands.Bot):
             f"""Logged in as {self.user} (ID: {self.user.id if self.user else "unknown"}) Servers: {guildstring.removesuffix(", ")}"""
         )
 
+        # guild objects are replaced when the gateway session is recreated
         guild = self.get_guild(SERVER_ID)
         if guild is None:
             logger.error(f"Could not find guild with ID {SERVER_ID}")
             raise RuntimeError(f"Could not find guild with ID {SERVER_ID}")
         self.lvguild = guild
 
+        # on_ready fires again after reconnects, startup only runs once
+        if not self.startup.begin():
+            logger.info("Reconnected, startup already done")
+            return
+
+        # Start Discord log processing task, so startup warnings are shipped too
+        self._log_task = asyncio.create_task(self._process_discord_logs())
+
+        # Task loops wait for update_user, the command sync runs alongside it
+        # and doesn't hold them back
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(self.startup.run("sync_commands", self.sync_commands()))
+            await self.startup.run("update_users", self._update_users())
+            # Mark on_ready as finished
+            self._on_ready_finished = True
+        logger.info(self.startup.summary())
+
+    async def sync_commands(self, force: bool = False) -> bool:
+        """Sync guild commands unless they match the last synced tree.
+
+        Returns whether a sync was done. The fingerprint of the synced tree
+        is stored in the database, so restarts without command changes
+        skip the rate limited sync request.
+        """
+        state_key = f"command_tree:{self.application_id}:{SERVER_ID}"
+        if not force:
+            try:
+                stored = await self.db.get_state(state_key)
+            except Exception:
+                logger.exception("Failed to read stored command tree fingerprint")
+                stored = None
+            if stored == self.command_fingerprint:
+                logger.info(
+                    f"Command tree unchanged ({self.command_fingerprint[:12]}), skipping sync"
+                )
+                return False
+
         # Debug: Log all commands in the tree before syncing
         all_commands = self.tree.get_commands()
         logger.info(
@@ -107,10 +219,15 @@ class OsuBot(commands.Bot):
                 )
         except discord.app_commands.CommandSyncFailure as e:
             logger.error(f"Command sync failure: {e}")
+            return False
         except Exception as e:
             logger.exception(f"Failed to sync commands: {e}")
+            return False
 
-        # Run update_user before other tasks start
+        await self.db.set_state(state_key, self.command_fingerprint)
+        return True
+
+    async def _update_users(self) -> None:
         # Import here to avoid circular import (utils imports from app)
         from utils import update_users_in_database
 
@@ -127,44 +244,14 @@ class OsuBot(commands.Bot):
             logger.exception(f"Failed to update users on startup: {e}")
             # Continue startup - the update_user command can be run manually if needed
 
-        # Mark on_ready as finished
-        self._on_ready_finished = True
-
-        # Start Discord log processing task
-        self._log_task = asyncio.create_task(self._process_discord_logs())
-
     async def _process_discord_logs(self) -> None:
-        """Process log messages from queue and send to Discord channel.
-        Sends up to 10 messages per second to respect rate limits."""
-        while not self.is_closed():
-            try:
-                # Collect up to 10 messages from the queue
-                messages: list[str] = []
-                for _ in range(10):
-                    try:
-                        message = _discord_log_queue.get_nowait()
-                        messages.append(str(message).strip())
-                    except queue.Empty:
-                        break
-
-                # If we have messages, send them
-                if messages:
-                    channel = self.get_channel(BOT_CHANNEL_ID)
-                    if channel and isinstance(channel, discord.TextChannel):
-                        # Truncate each message if too long (Discord limit is 2000 chars)
-                        # Account for code block markers: ```\n + \n``` = 7 chars
-                        max_length = 2000 - 7  # Reserve space for code block markers
-                        for message_text in messages:
-                            if len(message_text) > max_length:
-                                message_text = message_text[: max_length - 3] + "..."
-                            await channel.send(f"```\n{message_text}\n```")
-
-                # Wait 1 second before processing next batch (rate limit: 10 messages/second)
-                await asyncio.sleep(1.0)
-            except Exception as e:
-                # Log to stderr if Discord logging fails to avoid infinite loop
-                print(f"Error sending log to Discord: {e}", file=sys.stderr)
-                await asyncio.sleep(1.0)
+        """Send buffered log records to the bot channel as they arrive."""
+        await _discord_log_sink.run(self._send_log_message)
+
+    async def _send_log_message(self, content: str) -> None:
+        channel = self.get_channel(BOT_CHANNEL_ID)
+        if channel and isinstance(channel, discord.TextChannel):
+            await channel.send(content)
 
     async def close(self) -> None:
         if self._log_task:
@@ -173,6 +260,10 @@ class OsuBot(commands.Bot):
                 await self._log_task
             except asyncio.CancelledError:
                 pass
+        await self.dispatcher.close()
+        await self.players.close()
+        if hasattr(self, "pp"):
+            self.pp.close()
         if hasattr(self, "session") and self.session:
             await self.session.close()
         await super().close()
@@ -0,0 +1,213 @@
+"""Local store for `.osu` beatmap files used by the pp calculator.
+
+- downloads go through the bot's shared aiohttp session
+- concurrent requests for the same beatmap share a single download and parse
+- files are written to a temp file and renamed into place off the event loop
+- parsed `rosu_pp_py.Beatmap` objects are kept in an in-memory LRU
+- the directory is kept under a size cap by evicting least recently used files,
+  files in use by a calculation (see `use`) are never evicted
+- a file whose md5 no longer matches the checksum reported by the osu! API
+  (the map was updated) is downloaded again
+"""
+
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Coroutine
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+import aiohttp
+from loguru import logger
+
+if TYPE_CHECKING:
+    from rosu_pp_py import Beatmap
+
+BEATMAP_URL = "https://osu.ppy.sh/osu/{beatmap_id}"
+
+
+class BeatmapStore:
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        directory: Path,
+        max_bytes: int,
+        cache_size: int,
+    ) -> None:
+        self.session = session
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.cache_size = cache_size
+        self._parsed: OrderedDict[int, "Beatmap"] = OrderedDict()
+        self._downloads: dict[int, asyncio.Task[Path]] = {}
+        self._loads: dict[int, asyncio.Task["Beatmap"]] = {}
+        # beatmap_id -> (mtime_ns, md5) of the file on disk
+        self._checksums: dict[int, tuple[int, str]] = {}
+        # beatmap_id -> number of `use` blocks holding the file
+        self._in_use: dict[int, int] = {}
+
+    def path_for(self, beatmap_id: int) -> Path:
+        return self.directory / f"{beatmap_id}.osu"
+
+    async def get_path(self, beatmap_id: int, checksum: str | None = None) -> Path:
+        """Return the path of a beatmap file, downloading it if missing.
+
+        If `checksum` is given and the local file doesn't match it, the file
+        is treated as outdated and downloaded again.
+        """
+        path = self.path_for(beatmap_id)
+        if self._touch(path):
+            if checksum is None or await self.file_checksum(beatmap_id) == checksum:
+                return path
+            logger.info(f"Beatmap {beatmap_id} changed upstream, downloading it again")
+            self._parsed.pop(beatmap_id, None)
+
+        task = self._downloads.get(beatmap_id)
+        if task is None:
+            task = self._start(
+                self._downloads, beatmap_id, self._download(beatmap_id, path)
+            )
+        # shield so one cancelled waiter doesn't cancel the shared download
+        return await asyncio.shield(task)
+
+    @asynccontextmanager
+    async def use(
+        self, beatmap_id: int, checksum: str | None = None
+    ) -> AsyncIterator[Path]:
+        """Like `get_path`, but the file can't be evicted until the block ends."""
+        self._in_use[beatmap_id] = self._in_use.get(beatmap_id, 0) + 1
+        try:
+            yield await self.get_path(beatmap_id, checksum)
+        finally:
+            if self._in_use[beatmap_id] == 1:
+                del self._in_use[beatmap_id]
+            else:
+                self._in_use[beatmap_id] -= 1
+
+    async def get_beatmap(
+        self, beatmap_id: int, checksum: str | None = None
+    ) -> "Beatmap":
+        """Return a parsed beatmap, from memory if it was used recently."""
+        if checksum is not None:
+            # drops an outdated parsed beatmap along with the file
+            await self.get_path(beatmap_id, checksum)
+
+        beatmap = self._parsed.get(beatmap_id)
+        if beatmap is not None:
+            self._parsed.move_to_end(beatmap_id)
+            return beatmap
+
+        task = self._loads.get(beatmap_id)
+        if task is None:
+            task = self._start(self._loads, beatmap_id, self._load(beatmap_id))
+        return await asyncio.shield(task)
+
+    async def file_checksum(self, beatmap_id: int) -> str:
+        """Return the md5 hex digest of a downloaded beatmap file."""
+        path = self.path_for(beatmap_id)
+        mtime_ns = path.stat().st_mtime_ns
+        cached = self._checksums.get(beatmap_id)
+        if cached is not None and cached[0] == mtime_ns:
+            return cached[1]
+        digest = await asyncio.to_thread(
+            lambda: hashlib.md5(path.read_bytes()).hexdigest()
+        )
+        self._checksums[beatmap_id] = (mtime_ns, digest)
+        return digest
+
+    @staticmethod
+    def _start[T](
+        in_flight: dict[int, asyncio.Task[T]],
+        beatmap_id: int,
+        coro: Coroutine[Any, Any, T],
+    ) -> asyncio.Task[T]:
+        task = asyncio.create_task(coro)
+        in_flight[beatmap_id] = task
+        task.add_done_callback(lambda _: in_flight.pop(beatmap_id, None))
+        return task
+
+    async def _load(self, beatmap_id: int) -> "Beatmap":
+        path = await self.get_path(beatmap_id)
+        beatmap = await asyncio.to_thread(self._parse, path)
+        self._parsed[beatmap_id] = beatmap
+        while len(self._parsed) > self.cache_size:
+            self._parsed.popitem(last=False)
+        return beatmap
+
+    async def _download(self, beatmap_id: int, path: Path) -> Path:
+        url = BEATMAP_URL.format(beatmap_id=beatmap_id)
+        async with self.session.get(url) as resp:
+            if resp.status != 200:
+                raise RuntimeError(
+                    f"Downloading beatmap {beatmap_id} failed with status {resp.status}"
+                )
+            data = await resp.read()
+        if not data:
+            raise RuntimeError(f"Downloaded beatmap {beatmap_id} is empty")
+
+        await asyncio.to_thread(self._write_atomic, path, data)
+        await asyncio.to_thread(self._enforce_size_cap)
+        return path
+
+    @staticmethod
+    def _touch(path: Path) -> bool:
+        """Mark a file as used, returns False if it doesn't exist.
+
+        Bumps atime, keeping mtime (which marks the download), so the size
+        cap evicts least recently used files first.
+        """
+        try:
+            os.utime(path, ns=(time.time_ns(), path.stat().st_mtime_ns))
+        except FileNotFoundError:
+            return False
+        return True
+
+    @staticmethod
+    def _parse(path: Path) -> "Beatmap":
+        from rosu_pp_py import Beatmap
+
+        return Beatmap(path=str(path))
+
+    @staticmethod
+    def _write_atomic(path: Path, data: bytes) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(
+            dir=path.parent, prefix=f".{path.stem}.", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_name, path)
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+
+    def _enforce_size_cap(self) -> None:
+        files: list[tuple[float, int, Path]] = []
+        total = 0
+        for path in self.directory.glob("*.osu"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_atime, stat.st_size, path))
+            total += stat.st_size
+        if total <= self.max_bytes:
+            return
+
+        files.sort()
+        evicted = 0
+        for _, size, path in files:
+            if total <= self.max_bytes:
+                break
+            # read live, a calculation may have started since the scan
+            if path.stem.isdigit() and int(path.stem) in self._in_use:
+                continue
+            path.unlink(missing_ok=True)
+            total -= size
+            evicted += 1
+        logger.info(f"Evicted {evicted} beatmap file(s) to stay under the size cap")
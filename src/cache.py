@@ -0,0 +1,51 @@
+"""Small in-memory caches."""
+
+import time
+from collections import OrderedDict
+
+
+class TTLCache[K, V]:
+    """Bounded LRU mapping whose entries expire after a time to live.
+
+    Failed lookups can be remembered too (`set_failed`), with their own,
+    usually shorter, time to live, so they aren't retried on every call.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, negative_ttl: float = 0.0) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        # key -> (expires_at, value), value None marks a failed lookup
+        self._entries: OrderedDict[K, tuple[float, V | None]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: K) -> tuple[bool, V | None]:
+        """Return (hit, value). A hit with value None is a cached failure."""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return True, entry[1]
+
+    def set(self, key: K, value: V) -> None:
+        self._store(key, value, self.ttl)
+
+    def set_failed(self, key: K) -> None:
+        self._store(key, None, self.negative_ttl)
+
+    def pop(self, key: K) -> None:
+        self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _store(self, key: K, value: V | None, ttl: float) -> None:
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
@@ -135,6 +135,48 @@ class Commands(BaseCog):
         else:
             await interaction.followup.send("Nevienu nepievienoja datubāzei.")
 
+    @discord.app_commands.command(
+        name="sync_commands",
+        description="Sync slash commands to the server even if unchanged",
+    )
+    @discord.app_commands.check(admin_or_role_check)
+    async def sync_commands(self, interaction: discord.Interaction) -> None:
+        await interaction.response.defer(ephemeral=True)
+        if await self.bot.sync_commands(force=True):
+            await interaction.followup.send("Commands synced.", ephemeral=True)
+        else:
+            await interaction.followup.send(
+                "Command sync failed, see the logs.", ephemeral=True
+            )
+
+    @discord.app_commands.command(
+        name="db_stats", description="Show database connection pool statistics"
+    )
+    @discord.app_commands.check(admin_or_role_check)
+    async def db_stats(self, interaction: discord.Interaction) -> None:
+        db = self.bot.db
+        await interaction.response.send_message(
+            f"```\n{db.stats.describe(db.pool)}\n```", ephemeral=True
+        )
+
+    @discord.app_commands.command(
+        name="api_stats", description="Show osu! API request statistics"
+    )
+    @discord.app_commands.check(admin_or_role_check)
+    async def api_stats(self, interaction: discord.Interaction) -> None:
+        await interaction.response.send_message(
+            f"```\n{self.bot.osuapi.describe()[:1990]}\n```", ephemeral=True
+        )
+
+    @discord.app_commands.command(
+        name="dispatch_stats", description="Show outgoing message queue statistics"
+    )
+    @discord.app_commands.check(admin_or_role_check)
+    async def dispatch_stats(self, interaction: discord.Interaction) -> None:
+        await interaction.response.send_message(
+            f"```\n{self.bot.dispatcher.describe()[:1990]}\n```", ephemeral=True
+        )
+
     @discord.app_commands.command(
         name="purge_roles",
         description="Purge discord roles from players that aren't linked in the database",
@@ -142,26 +184,20 @@ class Commands(BaseCog):
     @discord.app_commands.check(admin_or_role_check)
     async def purge_roles(self, interaction: discord.Interaction) -> None:
         await interaction.response.defer()
-        async with self.bot.db.pool.acquire() as db:
-            result = await db.fetch(
-                "SELECT discord_id FROM players WHERE osu_id IS NOT NULL;"
-            )
-            db_id_list = [x[0] for x in result]
-            purged_count = 0
-            for member in self.bot.lvguild.members:
-                if member.id not in db_id_list:
-                    current_role_id = [
-                        role.id for role in member.roles if role.id in ROLES.values()
-                    ]
-                    if current_role_id != []:
-                        role = get(self.bot.lvguild.roles, id=current_role_id[0])
-                        if role:
-                            await member.remove_roles(role)
-                            purged_count += 1
-
-            await interaction.followup.send(
-                f"Purged roles for {purged_count} member(s)."
-            )
+        purged_count = 0
+        for member in self.bot.lvguild.members:
+            player = self.bot.players.get(member.id)
+            if player is None or player.osu_id is None:
+                current_role_id = [
+                    role.id for role in member.roles if role.id in ROLES.values()
+                ]
+                if current_role_id != []:
+                    role = get(self.bot.lvguild.roles, id=current_role_id[0])
+                    if role:
+                        await member.remove_roles(role)
+                        purged_count += 1
+
+        await interaction.followup.send(f"Purged roles for {purged_count} member(s).")
 
 
 async def setup(bot: OsuBot) -> None:
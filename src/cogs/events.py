@@ -15,27 +15,20 @@ class Events(commands.Cog):
         self, message: str, mention_users: bool = False
     ) -> None:
         """Helper method to send notifications to the designated channel"""
-        channel = self.bot.get_channel(self.NOTIFICATIONS_CHANNEL_ID)
-        if not channel or not isinstance(channel, discord.TextChannel):
-            raise ValueError(
-                f"Channel {self.NOTIFICATIONS_CHANNEL_ID} not found or is not a text channel"
-            )
-
         allowed_mentions = discord.AllowedMentions(users=mention_users)
-        await channel.send(message, allowed_mentions=allowed_mentions)
+        await self.bot.dispatcher.send(
+            self.NOTIFICATIONS_CHANNEL_ID, message, allowed_mentions=allowed_mentions
+        )
 
     @commands.Cog.listener()
     async def on_member_join(self, member: discord.Member) -> None:
-        result = await self.bot.db.get_user(member.id)
+        added = await self.bot.players.add(member.id)
         message = (
             f"{member.mention} pievienojās serverim!"
-            if not result
+            if added
             else f"{member.mention} atkal pievienojās serverim!"
         )
 
-        if not result:
-            await self.bot.db.create_user(member.id)
-
         await self._send_notification(message)
 
     @commands.Cog.listener()
@@ -1,9 +1,14 @@
+import asyncio
+from typing import NamedTuple
+
 import discord
 from discord.ext import commands, tasks
 from discord.utils import get
 from loguru import logger
 
 from app import OsuBot
+from cache import TTLCache
+from osu_api import is_retryable
 from utils import refresh_user_rank, wait_for_on_ready
 from ossapi import GameMode, UserLookupKey
 
@@ -13,198 +18,281 @@ OSU_APPLICATION_ID = 367827983903490050
 IMMIGRANT_ROLE_ID = 539951111382237198
 
 
+def osu_username(member: discord.Member) -> str | None:
+    """Return the osu! username from a member's osu! rich presence, if any."""
+    for activity in member.activities:
+        if getattr(activity, "application_id", None) != OSU_APPLICATION_ID:
+            continue
+        large_image_text = getattr(activity, "large_image_text", None)
+        if large_image_text is None:
+            continue
+        # large_image_text looks like "username (rank #1,234)"
+        username = large_image_text.split("(", 1)[0].removesuffix(" ")
+        if username == large_image_text:
+            continue
+        return username
+    return None
+
+
+class ResolvedUser(NamedTuple):
+    id: int
+    username: str
+    country_code: str | None
+
+
 class LinkUser(commands.Cog):
+    # wait this long after a presence change before linking, so a burst of
+    # updates (map changes, status changes) is handled once
+    LINK_DEBOUNCE_SECONDS = 30.0
+    # presence username -> osu! user resolution cache
+    USERNAME_CACHE_SIZE = 4096
+    USERNAME_CACHE_TTL = 6 * 60 * 60.0
+    # unknown usernames are retried after this long
+    USERNAME_NEGATIVE_TTL = 30 * 60.0
+
     def __init__(self, bot: OsuBot) -> None:
         self.bot = bot
         self.already_sent_messages: list[tuple[int, int]] = []
+        # member id -> osu! username last linked or checked successfully
+        self._last_seen: dict[int, str] = {}
+        # members whose osu! presence changed and still need a check
+        self._dirty: set[int] = set()
+        self._pending: dict[int, asyncio.Task[None]] = {}
+        self._full_scan_done = False
+        # members whose presence changed while the first scan was running
+        self._changed_during_scan: set[int] = set()
+        self._resolved: TTLCache[str, ResolvedUser] = TTLCache(
+            self.USERNAME_CACHE_SIZE,
+            ttl=self.USERNAME_CACHE_TTL,
+            negative_ttl=self.USERNAME_NEGATIVE_TTL,
+        )
         self.link_acc.start()
+        self.post_linked_users.start()
 
     async def cog_unload(self) -> None:
         self.link_acc.cancel()
+        self.post_linked_users.cancel()
+        for task in self._pending.values():
+            task.cancel()
 
-    @tasks.loop(minutes=5)
+    @commands.Cog.listener()
+    async def on_presence_update(
+        self, before: discord.Member, after: discord.Member
+    ) -> None:
+        username = osu_username(after)
+        if username is None or username == self._last_seen.get(after.id):
+            return
+
+        self._dirty.add(after.id)
+        if not self._full_scan_done:
+            # the scan may already have passed this member, it is linked
+            # once the scan is done
+            self._changed_during_scan.add(after.id)
+            return
+        self._schedule_link(after)
+
+    def _schedule_link(self, member: discord.Member) -> None:
+        pending = self._pending.get(member.id)
+        if pending is not None:
+            pending.cancel()
+        self._pending[member.id] = asyncio.create_task(self._debounced_link(member))
+
+    async def _debounced_link(self, member: discord.Member) -> None:
+        try:
+            await asyncio.sleep(self.LINK_DEBOUNCE_SECONDS)
+        except asyncio.CancelledError:
+            return
+        self._pending.pop(member.id, None)
+        await self._check_member(member)
+
+    @tasks.loop(minutes=30)
     async def link_acc(self) -> None:
+        """Safety net for presence events.
+
+        The first run checks every member, later runs only retry members
+        whose osu! presence changed but couldn't be checked yet.
+        """
         logger.info("Starting link_acc task execution")
-        ctx: discord.TextChannel | None = None
         try:
-            channel = self.bot.get_channel(BOT_CHANNEL_ID)
-            if not isinstance(channel, discord.TextChannel):
-                raise ValueError(
-                    f"Channel {BOT_CHANNEL_ID} not found or is not a text channel"
-                )
-            ctx = channel
-            async with self.bot.db.pool.acquire() as db:
-                for guild in self.bot.guilds:
-                    for member in guild.members:
-                        if member.activities is not None:
-                            for osu_activity in member.activities:
-                                try:
-                                    if not hasattr(osu_activity, "application_id"):
-                                        continue
-                                    if (
-                                        getattr(osu_activity, "application_id", None)
-                                        == OSU_APPLICATION_ID
-                                    ):
-                                        if not hasattr(
-                                            osu_activity, "large_image_text"
-                                        ):
-                                            continue
-
-                                        large_image_text = getattr(
-                                            osu_activity, "large_image_text", None
-                                        )
-                                        if large_image_text is None:
-                                            continue
-
-                                        username = large_image_text.split("(", 1)[
-                                            0
-                                        ].removesuffix(" ")
-                                        if username == large_image_text:
-                                            continue
-
-                                        try:
-                                            osu_user = await self.bot.osuapi.user(
-                                                username,
-                                                mode=GameMode.OSU,
-                                                key=UserLookupKey.USERNAME,
-                                            )
-                                        except Exception as e:
-                                            # API call failed (user not found, rate limit, network error, etc.)
-                                            # Log at debug level since this is expected for invalid usernames
-                                            logger.debug(
-                                                f"Failed to fetch osu! user '{username}' for member {member.id}: {e}"
-                                            )
-                                            continue
-
-                                        queryString = f"SELECT discord_id, osu_id FROM players WHERE discord_id = {member.id} AND osu_id IS NOT NULL"
-
-                                        result = await db.fetch(queryString)
-                                        if result == []:
-                                            in_db_check = await db.fetch(
-                                                f"SELECT discord_id FROM players WHERE discord_id = {member.id}"
-                                            )
-                                            if in_db_check == []:
-                                                logger.error(
-                                                    f"link_user: discord member {member.id} not in db"
-                                                )
-                                                continue
-
-                                            country_code = getattr(
-                                                osu_user,
-                                                "country_code",
-                                                getattr(osu_user.country, "code", None),
-                                            )
-                                            if country_code == "LV":
-                                                result = await db.fetch(
-                                                    f"SELECT discord_id, osu_id FROM players WHERE osu_id = {osu_user.id};"
-                                                )
-                                                if result == []:
-                                                    await db.execute(
-                                                        f"UPDATE players SET osu_id = {osu_user.id} WHERE discord_id = {member.id};"
-                                                    )
-                                                    if ctx:
-                                                        await ctx.send(
-                                                            f"Pievienoja {member.mention} datubāzei ar osu! kontu {osu_user.username} (id: {osu_user.id})",
-                                                            allowed_mentions=discord.AllowedMentions(
-                                                                users=False
-                                                            ),
-                                                        )
-                                                    await refresh_user_rank(
-                                                        member, self.bot
-                                                    )
-                                                    continue
-                                                # check if discord multiaccounter
-                                                if member.id != result[0][0]:
-                                                    await db.execute(
-                                                        f"UPDATE players SET osu_id = {osu_user.id} WHERE discord_id = {member.id};"
-                                                    )
-                                                    await db.execute(
-                                                        f"UPDATE players SET osu_id = NULL WHERE discord_id = {result[0][0]};"
-                                                    )
-                                                    if ctx:
-                                                        await ctx.send(
-                                                            f"Lietotājs {member.mention} spēlē uz osu! konta (id: {osu_user.id}), kas linkots ar <@{result[0][0]}>. Vecais konts unlinkots un linkots jaunais."
-                                                        )
-                                                    await refresh_user_rank(
-                                                        member, self.bot
-                                                    )
-
-                                            else:
-                                                if (
-                                                    member.get_role(IMMIGRANT_ROLE_ID)
-                                                    is None
-                                                ):
-                                                    role = get(
-                                                        self.bot.lvguild.roles,
-                                                        id=IMMIGRANT_ROLE_ID,
-                                                    )
-                                                    if role is None:
-                                                        raise ValueError(
-                                                            f"Role {IMMIGRANT_ROLE_ID} not found in guild"
-                                                        )
-                                                    await member.add_roles(role)
-                                                    if ctx:
-                                                        await ctx.send(
-                                                            f"Lietotājs {member.mention} nav no Latvijas! (Pievienots imigranta role)"
-                                                        )
-
-                                        else:
-                                            logger.info(
-                                                f"{member.mention} jau eksistē datubāzē"
-                                            )
-
-                                            # check if osu multiaccount (datbase osu_id != activity osu_id)
-                                            # logger.info(result[0][1])
-                                            if osu_user.id != result[0][1]:
-                                                if (
-                                                    osu_user.id,
-                                                    result[0][1],
-                                                ) not in self.already_sent_messages:
-                                                    if ctx:
-                                                        await ctx.send(
-                                                            f"Lietotājs {member.mention} jau eksistē ar osu! id {result[0][1]}, bet pašlaik spēlē uz cita osu! konta ar id = {osu_user.id} username = {osu_user.username}."
-                                                        )
-                                                    self.already_sent_messages.append(
-                                                        (osu_user.id, result[0][1])
-                                                    )
-                                                else:
-                                                    continue
-
-                                except Exception:
-                                    # Catch any unexpected errors and continue to next activity
-                                    logger.exception("error in link_acc")
-                                    continue
-            logger.info("link acc finished")
-            if POST_REQUEST_URL and POST_REQUEST_TOKEN:
-                try:
-                    async with self.bot.db.pool.acquire() as db:
-                        result = await db.fetch(
-                            "SELECT discord_id, osu_id FROM players WHERE osu_id IS NOT NULL;"
-                        )
-                        result_json = [
-                            {"discord_id": str(r[0]), "osu_id": str(r[1])}
-                            for r in result
-                        ]
-                        resp = await self.bot.session.post(
-                            POST_REQUEST_URL,
-                            json={"users": result_json},
-                            headers={"Authorization": POST_REQUEST_TOKEN},
-                        )
-                        if resp.status == 201:
-                            logger.info(
-                                f"{resp.status}: posted {len(result)} users to post_request_url"
-                            )
-                        else:
-                            logger.error(
-                                f"{resp.status}: failed to post {len(result)} users to post_request_url"
-                            )
-                except Exception:
-                    logger.exception("error in posting users to post_request_url")
+            if not self._full_scan_done:
+                members = [
+                    member for guild in self.bot.guilds for member in guild.members
+                ]
+            else:
+                members = [
+                    member
+                    for member_id in list(self._dirty)
+                    if member_id not in self._pending
+                    and (member := self.bot.lvguild.get_member(member_id)) is not None
+                ]
+            for member in members:
+                await self._check_member(member)
+            if not self._full_scan_done:
+                self._full_scan_done = True
+                self._link_changed_during_scan()
+            logger.info(f"link acc finished, checked {len(members)} member(s)")
+        except Exception:
+            logger.exception("error in link_acc")
 
-        except Exception as e:
+    def _link_changed_during_scan(self) -> None:
+        for member_id in self._changed_during_scan & self._dirty:
+            member = self.bot.lvguild.get_member(member_id)
+            if member is not None:
+                self._schedule_link(member)
+        self._changed_during_scan.clear()
+
+    async def _check_member(self, member: discord.Member) -> None:
+        username = osu_username(member)
+        if username is None:
+            self._dirty.discard(member.id)
+            return
+        try:
+            if await self.link_member(member, username):
+                self._last_seen[member.id] = username
+                self._dirty.discard(member.id)
+        except Exception:
+            # Catch any unexpected errors and continue with the next member
             logger.exception("error in link_acc")
 
+    async def _notify(
+        self,
+        message: str,
+        allowed_mentions: discord.AllowedMentions | None = None,
+    ) -> None:
+        await self.bot.dispatcher.send(
+            BOT_CHANNEL_ID, message, allowed_mentions=allowed_mentions
+        )
+
+    async def link_member(self, member: discord.Member, username: str) -> bool:
+        """Link a member to the osu! account they are playing on.
+
+        Returns False if the osu! user could not be fetched, so the check
+        is retried later.
+        """
+        osu_user = await self.resolve_username(username)
+        if osu_user is None:
+            return False
+
+        players = self.bot.players
+        player = players.get(member.id)
+        if player is None:
+            logger.error(f"link_user: discord member {member.id} not in db")
+            return True
+
+        if player.osu_id is None:
+            if osu_user.country_code == "LV":
+                owner = players.by_osu_id(osu_user.id)
+                if owner is None:
+                    await players.link(member.id, osu_user.id)
+                    await self._notify(
+                        f"Pievienoja {member.mention} datubāzei ar osu! kontu {osu_user.username} (id: {osu_user.id})",
+                        allowed_mentions=discord.AllowedMentions(users=False),
+                    )
+                    await refresh_user_rank(member, self.bot)
+                    return True
+                # check if discord multiaccounter
+                if member.id != owner.discord_id:
+                    # takes the account over from the old owner
+                    await players.link(member.id, osu_user.id)
+                    await self._notify(
+                        f"Lietotājs {member.mention} spēlē uz osu! konta (id: {osu_user.id}), kas linkots ar <@{owner.discord_id}>. Vecais konts unlinkots un linkots jaunais."
+                    )
+                    await refresh_user_rank(member, self.bot)
+
+            else:
+                if member.get_role(IMMIGRANT_ROLE_ID) is None:
+                    role = get(self.bot.lvguild.roles, id=IMMIGRANT_ROLE_ID)
+                    if role is None:
+                        raise ValueError(f"Role {IMMIGRANT_ROLE_ID} not found in guild")
+                    await member.add_roles(role)
+                    await self._notify(
+                        f"Lietotājs {member.mention} nav no Latvijas! (Pievienots imigranta role)"
+                    )
+
+        else:
+            logger.info(f"{member.mention} jau eksistē datubāzē")
+
+            # check if osu multiaccount (datbase osu_id != activity osu_id)
+            if osu_user.id != player.osu_id:
+                if (osu_user.id, player.osu_id) not in self.already_sent_messages:
+                    await self._notify(
+                        f"Lietotājs {member.mention} jau eksistē ar osu! id {player.osu_id}, bet pašlaik spēlē uz cita osu! konta ar id = {osu_user.id} username = {osu_user.username}."
+                    )
+                    self.already_sent_messages.append((osu_user.id, player.osu_id))
+        return True
+
+    async def resolve_username(self, username: str) -> ResolvedUser | None:
+        """Resolve an osu! username, using cached results where possible.
+
+        Returns None if the user could not be fetched. Usernames the API
+        rejects are remembered for a while so they aren't looked up every
+        time the member's presence is checked.
+        """
+        # osu! usernames are case insensitive
+        key = username.lower()
+        hit, resolved = self._resolved.get(key)
+        if hit:
+            return resolved
+
+        try:
+            osu_user = await self.bot.osuapi.user(
+                username,
+                mode=GameMode.OSU,
+                key=UserLookupKey.USERNAME,
+            )
+        except ValueError as e:
+            if is_retryable(e):
+                logger.debug(f"Failed to fetch osu! user '{username}': {e}")
+                return None
+            # the API answered with an error, e.g. the user does not exist
+            logger.debug(f"osu! user '{username}' could not be resolved: {e}")
+            self._resolved.set_failed(key)
+            return None
+        except Exception as e:
+            # rate limit, network error, etc. are not cached
+            logger.debug(f"Failed to fetch osu! user '{username}': {e}")
+            return None
+
+        resolved = ResolvedUser(
+            id=osu_user.id,
+            username=osu_user.username,
+            country_code=getattr(
+                osu_user, "country_code", getattr(osu_user.country, "code", None)
+            ),
+        )
+        self._resolved.set(key, resolved)
+        return resolved
+
+    # on its own loop, links made from presence events are pushed within
+    # minutes while link_acc only runs as a safety net
+    @tasks.loop(minutes=5)
+    async def post_linked_users(self) -> None:
+        if not (POST_REQUEST_URL and POST_REQUEST_TOKEN):
+            return
+        try:
+            result = self.bot.players.linked()
+            result_json = [
+                {"discord_id": str(p.discord_id), "osu_id": str(p.osu_id)}
+                for p in result
+            ]
+            resp = await self.bot.session.post(
+                POST_REQUEST_URL,
+                json={"users": result_json},
+                headers={"Authorization": POST_REQUEST_TOKEN},
+            )
+            if resp.status == 201:
+                logger.info(
+                    f"{resp.status}: posted {len(result)} users to post_request_url"
+                )
+            else:
+                logger.error(
+                    f"{resp.status}: failed to post {len(result)} users to post_request_url"
+                )
+        except Exception:
+            logger.exception("error in posting users to post_request_url")
+
     @link_acc.before_loop
+    @post_linked_users.before_loop
     async def before_link_acc(self) -> None:
         await self.bot.wait_until_ready()
         await wait_for_on_ready(self.bot)
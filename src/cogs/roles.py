@@ -1,19 +1,29 @@
-from discord.ext import commands, tasks
-from discord.utils import get
+import discord
+from discord.ext import tasks
 from loguru import logger
-from config import ROLES, REV_ROLES, ROLES_VALUE
+from config import ROLES, REV_ROLES, SERVER_ID
 from app import OsuBot
+from osu_api import Priority
+from ranking import RankingSnapshot, fetch_country_ranking
+from reconcile import (
+    RoleTransition,
+    describe_plan,
+    plan_role_changes,
+    unranked_players,
+)
 
 from utils import (
-    get_role_with_rank,
+    BaseCog,
+    admin_or_role_check,
     change_role,
     send_rolechange_msg,
     wait_for_on_ready,
 )
-from ossapi import GameMode, RankingType, UserLookupKey, Cursor
+from ossapi import GameMode, UserLookupKey
+from ossapi.models import User
 
 
-class RolesCog(commands.Cog):
+class RolesCog(BaseCog):
     def __init__(self, bot: OsuBot) -> None:
         self.bot = bot
         self.refresh_roles.start()
@@ -21,190 +31,101 @@ class RolesCog(commands.Cog):
     async def cog_unload(self) -> None:
         self.refresh_roles.cancel()
 
+    @discord.app_commands.command(
+        name="roles_plan",
+        description="Show the rank role changes the next refresh would make",
+    )
+    @discord.app_commands.check(admin_or_role_check)
+    async def roles_plan(self, interaction: discord.Interaction) -> None:
+        await interaction.response.defer()
+        plan = await self.reconcile_roles(dry_run=True, priority=Priority.INTERACTIVE)
+        await interaction.followup.send(
+            describe_plan(plan)[:2000],
+            allowed_mentions=discord.AllowedMentions(users=False),
+        )
+
     @tasks.loop(minutes=15)
     async def refresh_roles(self) -> None:
         logger.info("Starting refresh_roles task execution")
         try:
-            # ctx = self.bot.get_channel(BOT_CHANNEL_ID)
-            async with self.bot.db.pool.acquire() as db:
-                ranking = []
-                # get the first 1000 players from LV country leaderboard
-                cursor = None
-                for i in range(20):
-                    resp = await self.bot.osuapi.ranking(
-                        GameMode.OSU,
-                        RankingType.PERFORMANCE,
-                        country="LV",
-                        cursor=cursor,
-                    )
-                    ranking.extend(resp.ranking)
-                    # Stop if we got no results (last page)
-                    if len(resp.ranking) == 0:
-                        break
-                    # Use cursor from response for next page, or fallback to page-based pagination
-                    if resp.cursor is not None:
-                        cursor = resp.cursor
-                    else:
-                        # Fallback to page-based pagination if cursor not available
-                        cursor = Cursor(page=i + 2)
-
-                ranking_id_list = [x.user.id for x in ranking]
-
-                result = await db.fetch(
-                    "SELECT discord_id, osu_id FROM players WHERE osu_id IS NOT NULL;"
-                )
-
-                member_id_list = [x.id for x in self.bot.lvguild.members]
-
-                for row in result:
-                    if row[0] not in member_id_list:
-                        continue
-                    try:
-                        country_rank = ranking_id_list.index(row[1]) + 1
-                    except ValueError:
-                        country_rank = 99999
-
-                    member = get(self.bot.lvguild.members, id=row[0])
-                    if member is None:
-                        continue
-                    current_role = [
-                        REV_ROLES[role.id]
-                        for role in member.roles
-                        if role.id in ROLES.values()
-                    ]
-
-                    if country_rank == 99999:
-                        try:
-                            osu_user = await self.bot.osuapi.user(
-                                row[1], mode=GameMode.OSU, key=UserLookupKey.ID
-                            )
-                        except Exception as e:
-                            osu_user = None
-
-                        if osu_user is None:
-                            if current_role == []:
-                                await change_role(
-                                    bot=self.bot,
-                                    discord_id=row[0],
-                                    new_role_id=ROLES["restricted"],
-                                )
-                                await send_rolechange_msg(
-                                    bot=self.bot,
-                                    discord_id=row[0],
-                                    notikums="restricted",
-                                    osu_user=None,
-                                )
-                                continue
-                            if ROLES[current_role[0]] != ROLES["restricted"]:
-                                await change_role(
-                                    bot=self.bot,
-                                    discord_id=row[0],
-                                    current_role_id=ROLES[current_role[0]],
-                                    new_role_id=ROLES["restricted"],
-                                )
-                                await send_rolechange_msg(
-                                    bot=self.bot,
-                                    discord_id=row[0],
-                                    notikums="restricted",
-                                    osu_user=None,
-                                )
-                            continue
-
-                        is_ranked = getattr(osu_user.statistics, "is_ranked", True)
-                        if not is_ranked:
-                            if current_role == []:
-                                await change_role(
-                                    bot=self.bot,
-                                    discord_id=row[0],
-                                    new_role_id=ROLES["inactive"],
-                                )
-                                await send_rolechange_msg(
-                                    bot=self.bot,
-                                    discord_id=row[0],
-                                    notikums="inactive",
-                                    osu_user=osu_user,
-                                )
-                                continue
-                            if ROLES[current_role[0]] != ROLES["inactive"]:
-                                await change_role(
-                                    bot=self.bot,
-                                    discord_id=row[0],
-                                    current_role_id=ROLES[current_role[0]],
-                                    new_role_id=ROLES["inactive"],
-                                )
-                                await send_rolechange_msg(
-                                    bot=self.bot,
-                                    discord_id=row[0],
-                                    notikums="inactive",
-                                    osu_user=osu_user,
-                                )
-                            continue
-
-                    new_role = await get_role_with_rank(country_rank)
-
-                    if current_role == []:
-                        await change_role(
-                            bot=self.bot, discord_id=row[0], new_role_id=ROLES[new_role]
-                        )
-                        await send_rolechange_msg(
-                            bot=self.bot,
-                            discord_id=row[0],
-                            notikums="no_previous_role",
-                            role=new_role,
-                            osu_id=row[1],
-                        )
-
-                    elif current_role[0] == "restricted":
-                        await change_role(
-                            bot=self.bot,
-                            discord_id=row[0],
-                            current_role_id=ROLES[current_role[0]],
-                            new_role_id=ROLES[new_role],
-                        )
-                        await send_rolechange_msg(
-                            bot=self.bot,
-                            discord_id=row[0],
-                            notikums="unrestricted",
-                            role=new_role,
-                            osu_id=row[1],
-                        )
-
-                    elif new_role != current_role[0]:
-                        if ROLES_VALUE[new_role] < ROLES_VALUE[current_role[0]]:
-                            await change_role(
-                                bot=self.bot,
-                                discord_id=row[0],
-                                current_role_id=ROLES[current_role[0]],
-                                new_role_id=ROLES[new_role],
-                            )
-                            await send_rolechange_msg(
-                                bot=self.bot,
-                                discord_id=row[0],
-                                notikums="pacelas",
-                                role=new_role,
-                                osu_id=row[1],
-                            )
-                            continue
-                        if ROLES_VALUE[new_role] > ROLES_VALUE[current_role[0]]:
-                            await change_role(
-                                bot=self.bot,
-                                discord_id=row[0],
-                                current_role_id=ROLES[current_role[0]],
-                                new_role_id=ROLES[new_role],
-                            )
-                            await send_rolechange_msg(
-                                bot=self.bot,
-                                discord_id=row[0],
-                                notikums="nokritas",
-                                role=new_role,
-                                osu_id=row[1],
-                            )
-                            continue
-
+            await self.reconcile_roles(priority=Priority.BACKGROUND)
             logger.info("roles refreshed")
         except Exception:
             logger.exception("error in refresh_roles")
 
+    async def reconcile_roles(
+        self, dry_run: bool = False, priority: Priority = Priority.DEFAULT
+    ) -> list[RoleTransition]:
+        """Plan rank role changes and apply them unless `dry_run` is set."""
+        # get the first 1000 players from LV country leaderboard
+        ranking = RankingSnapshot(
+            await fetch_country_ranking(
+                self.bot.osuapi, country="LV", priority=priority
+            )
+        )
+        self.bot.ranking = ranking
+        rank_index = ranking.ranks
+
+        players = [
+            (player.discord_id, player.osu_id)
+            for player in self.bot.players.linked()
+            if player.osu_id is not None
+        ]
+
+        member_roles = {
+            member.id: [
+                REV_ROLES[role.id] for role in member.roles if role.id in REV_ROLES
+            ]
+            for member in self.bot.lvguild.members
+        }
+
+        # players outside the fetched pages need a lookup to tell restricted
+        # and inactive accounts apart from low ranked ones
+        unranked_users: dict[int, User | None] = {}
+        for osu_id in unranked_players(rank_index, players, member_roles):
+            try:
+                unranked_users[osu_id] = await self.bot.osuapi.user(
+                    osu_id, mode=GameMode.OSU, key=UserLookupKey.ID, priority=priority
+                )
+            except Exception:
+                unranked_users[osu_id] = None
+
+        plan = plan_role_changes(rank_index, players, member_roles, unranked_users)
+        logger.info(f"refresh_roles planned {len(plan)} role change(s)")
+
+        if not dry_run:
+            await self.apply_role_plan(plan)
+        return plan
+
+    async def apply_role_plan(self, plan: list[RoleTransition]) -> None:
+        """Apply planned role transitions and announce each of them."""
+        ranking = self.bot.ranking
+        for transition in plan:
+            # ranked players' names and avatars come with the ranking
+            osu_user = transition.osu_user
+            if osu_user is None and ranking is not None:
+                entry = ranking.get(transition.osu_id)
+                if entry is not None:
+                    osu_user = entry.user
+            try:
+                await change_role(
+                    bot=self.bot,
+                    discord_id=transition.discord_id,
+                    new_role_id=ROLES[transition.new_role],
+                )
+                await send_rolechange_msg(
+                    bot=self.bot,
+                    discord_id=transition.discord_id,
+                    notikums=transition.notikums,
+                    role=transition.new_role,
+                    osu_id=transition.osu_id,
+                    osu_user=osu_user,
+                )
+            except Exception:
+                logger.exception(
+                    f"error applying role change {transition.notikums} for discord id {transition.discord_id}"
+                )
+
     @refresh_roles.before_loop
     async def before_refresh_roles(self) -> None:
         await self.bot.wait_until_ready()
@@ -212,4 +133,4 @@ class RolesCog(commands.Cog):
 
 
 async def setup(bot: OsuBot) -> None:
-    await bot.add_cog(RolesCog(bot))
+    await bot.add_cog(RolesCog(bot), guild=discord.Object(id=SERVER_ID))
@@ -1,20 +1,17 @@
+import asyncio
+import time
 import discord
 from discord.ext import tasks
-from discord.utils import get
-from dateutil import parser
 from datetime import datetime, timedelta, timezone
-from rosu_pp_py import Beatmap, Performance, BeatmapAttributesBuilder
-import time
-import os
-import aiohttp
 from loguru import logger
 from app import OsuBot
+from osu_api import Priority
+from players import Player, PlayerRegistry
 from utils import admin_or_role_check, BaseCog, wait_for_on_ready
-from pathlib import Path
 
 from config import (
     REV_ROLES,
-    ROLES,
+    NEWBEST_WORKERS,
     ROLES_VALUE,
     USER_NEWBEST_LIMIT,
     BOTSPAM_CHANNEL_ID,
@@ -30,7 +27,48 @@ if TYPE_CHECKING:
     from ossapi.models import Mod
 
 
+class LastCheckedBatch:
+    """Collects checked players and writes their `last_checked` in batches.
+
+    A batch is written once it reaches `size` players or `interval` seconds
+    have passed since the last write, so progress survives a crash mid-scan.
+    A failed write is retried with the next batch.
+    """
+
+    def __init__(self, players: PlayerRegistry, size: int, interval: float) -> None:
+        self.players = players
+        self.size = size
+        self.interval = interval
+        self._pending: list[tuple[int, datetime]] = []
+        self._last_flush = time.monotonic()
+
+    def add(self, discord_id: int, checked_at: datetime) -> None:
+        self._pending.append((discord_id, checked_at.replace(microsecond=0)))
+
+    async def maybe_flush(self) -> None:
+        if (
+            len(self._pending) >= self.size
+            or time.monotonic() - self._last_flush >= self.interval
+        ):
+            await self.flush()
+
+    async def flush(self) -> None:
+        # swap before awaiting so concurrent workers keep adding to a new list
+        pending, self._pending = self._pending, []
+        self._last_flush = time.monotonic()
+        try:
+            await self.players.mark_checked(pending)
+        except Exception:
+            # keep them for the next flush, their scores are already posted
+            self._pending[:0] = pending
+            logger.exception(f"error saving last_checked for {len(pending)} player(s)")
+
+
 class UserNewbest(BaseCog):
+    # last_checked writes are batched by this many players or seconds
+    LAST_CHECKED_BATCH_SIZE = 50
+    LAST_CHECKED_FLUSH_INTERVAL = 30.0
+
     def __init__(self, bot: OsuBot) -> None:
         self.bot = bot
         self.user_newbest_loop.start()
@@ -61,62 +99,72 @@ class UserNewbest(BaseCog):
     async def user_newbest_loop(self) -> None:
         try:
             logger.info("Starting user_newbest_loop task execution")
-            async with self.bot.db.pool.acquire() as db:
-                result = await db.fetch(
-                    "SELECT * FROM players WHERE osu_id IS NOT NULL;"
-                )
-                member_id_list = [x.id for x in self.bot.lvguild.members]
-
-                for row in result:
-                    try:
-                        if row[0] not in member_id_list:
-                            continue
-
-                        member = get(self.bot.lvguild.members, id=row[0])
-                        if member is None:
-                            raise ValueError(
-                                f"user_newbest_loop: Member {row[0]} not found in guild"
-                            )
-                        current_roles = [
-                            REV_ROLES[role.id]
-                            for role in member.roles
-                            if role.id in ROLES.values()
-                        ]
-                        if not current_roles:
-                            continue
-                        current_role = current_roles[0]
-                        if ROLES_VALUE[current_role] > 9:
-                            continue
-
-                        if row[2] is None:
-                            last_checked = datetime.now(tz=timezone.utc) - timedelta(
-                                minutes=60
-                            )
-                        else:
-                            last_checked = parser.parse(row[2])
-
-                        limit = USER_NEWBEST_LIMIT[current_role]
-
-                        await self.get_user_newbest(
-                            osu_id=row[1], limit=limit, last_checked=last_checked
-                        )
-
-                        await db.execute(
-                            f"UPDATE players SET last_checked = '{datetime.now(tz=timezone.utc).replace(microsecond=0).isoformat()}' WHERE discord_id = {row[0]}"
-                        )
-
-                        time.sleep(0.1)
-
-                    except Exception:
-                        logger.exception(
-                            f"error in user_newbest_loop while processing user with discord id {row[0]} and osu id {row[1]}"
-                        )
-                        continue
-
-                logger.info("user_newbest_loop finished")
+            queue: asyncio.Queue[Player] = asyncio.Queue()
+            for player in self.bot.players.linked():
+                queue.put_nowait(player)
+
+            checked = LastCheckedBatch(
+                self.bot.players,
+                self.LAST_CHECKED_BATCH_SIZE,
+                self.LAST_CHECKED_FLUSH_INTERVAL,
+            )
+            # workers share the bot wide osu! API rate limit, so adding workers
+            # overlaps request latency without exceeding the quota
+            try:
+                async with asyncio.TaskGroup() as tg:
+                    for _ in range(max(1, NEWBEST_WORKERS)):
+                        tg.create_task(self._newbest_worker(queue, checked))
+            finally:
+                await checked.flush()
+
+            logger.info("user_newbest_loop finished")
         except Exception:
             logger.exception("error in user_newbest_loop")
 
+    async def _newbest_worker(
+        self, queue: asyncio.Queue[Player], checked: LastCheckedBatch
+    ) -> None:
+        while True:
+            try:
+                player = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                if await self.check_player(player):
+                    checked.add(player.discord_id, datetime.now(tz=timezone.utc))
+                    await checked.maybe_flush()
+            except Exception:
+                logger.exception(
+                    f"error in user_newbest_loop while processing user with discord id {player.discord_id} and osu id {player.osu_id}"
+                )
+
+    async def check_player(self, player: Player) -> bool:
+        """Post new top scores of a player, returns whether they were checked."""
+        if player.osu_id is None:
+            return False
+        member = self.bot.lvguild.get_member(player.discord_id)
+        if member is None:
+            return False
+        current_roles = [
+            REV_ROLES[role.id] for role in member.roles if role.id in REV_ROLES
+        ]
+        if not current_roles:
+            return False
+        current_role = current_roles[0]
+        if ROLES_VALUE[current_role] > 9:
+            return False
+
+        last_checked = player.last_checked
+        if last_checked is None:
+            last_checked = datetime.now(tz=timezone.utc) - timedelta(minutes=60)
+
+        limit = USER_NEWBEST_LIMIT[current_role]
+
+        await self.get_user_newbest(
+            osu_id=player.osu_id, limit=limit, last_checked=last_checked
+        )
+        return True
+
     @user_newbest_loop.before_loop
     async def before_user_newbest(self) -> None:
         await self.bot.wait_until_ready()
@@ -131,17 +179,24 @@ class UserNewbest(BaseCog):
             include_fails=False,
             limit=limit,
             mode=GameMode.OSU,
+            priority=Priority.BACKGROUND,
         )
         osu_user = None
         score_ids = []
         for index, score in enumerate(user_scores, start=1):
             score_time = score.ended_at
             if isinstance(score_time, str):
+                # rarely needed, so dateutil is only imported here
+                from dateutil import parser
+
                 score_time = parser.parse(score_time)
             if score_time > last_checked:
                 if osu_user is None:
                     osu_user = await self.bot.osuapi.user(
-                        osu_id, mode=GameMode.OSU, key=UserLookupKey.ID
+                        osu_id,
+                        mode=GameMode.OSU,
+                        key=UserLookupKey.ID,
+                        priority=Priority.BACKGROUND,
                     )
                 await self.post_user_newbest(
                     score=score,
@@ -166,11 +221,6 @@ class UserNewbest(BaseCog):
         scoretime: datetime,
         osu_user: User,
     ) -> None:
-        channel = self.bot.get_channel(BOTSPAM_CHANNEL_ID)
-        if not channel or not isinstance(channel, discord.TextChannel):
-            raise ValueError(
-                f"post_user_newbest: Channel {BOTSPAM_CHANNEL_ID} not found or is not a text channel"
-            )
         embed_color = 0x0084FF
 
         if score.ruleset_id != 0:
@@ -186,45 +236,26 @@ class UserNewbest(BaseCog):
 
         beatmap_id = score.beatmap_id
 
-        path = Path(os.getcwd(), "beatmaps", f"{beatmap_id}.osu")
-
-        if not path.exists():
-            async with aiohttp.ClientSession() as s:
-                url = f"https://osu.ppy.sh/osu/{beatmap_id}"
-                async with s.get(url) as resp:
-                    if resp.status == 200:
-                        path.parent.mkdir(parents=True, exist_ok=True)
-                        with path.open(
-                            mode="wb",
-                        ) as f:
-                            f.write(await resp.read())
-
-        with path.open(mode="rb") as f:
-            beatmap = Beatmap(bytes=f.read())
-
-        perf = Performance(lazer=False)
-        mapattr = BeatmapAttributesBuilder()
-
         score_mods = score.mods
-        perf.set_mods(mods=[{"acronym": mod.acronym} for mod in score_mods])
-        calc_result = perf.calculate(beatmap)
-
-        mapattr.set_map(beatmap)
-        map_attrs = mapattr.build()
+        calc_result = await self.bot.pp.calculate(
+            beatmap_id,
+            [mod.acronym for mod in score_mods],
+            checksum=score.beatmap.checksum,
+        )
 
         total_length = score.beatmap.total_length
         time_text = (
             str(timedelta(seconds=total_length)).removeprefix("0:")
-            if map_attrs.clock_rate == 1
-            else f"{str(timedelta(seconds=total_length)).removeprefix('0:')} ({str(timedelta(seconds=round(total_length / map_attrs.clock_rate))).removeprefix('0:')})"
+            if calc_result.clock_rate == 1
+            else f"{str(timedelta(seconds=total_length)).removeprefix('0:')} ({str(timedelta(seconds=round(total_length / calc_result.clock_rate))).removeprefix('0:')})"
         )
         bpm = score.beatmap.bpm
         if bpm is None:
             raise ValueError("Score beatmap BPM is missing")
         bpm_text = (
             f"{bpm} BPM"
-            if map_attrs.clock_rate == 1
-            else f"{bpm} -> **{round(int(bpm) * map_attrs.clock_rate)} BPM**"
+            if calc_result.clock_rate == 1
+            else f"{bpm} -> **{round(int(bpm) * calc_result.clock_rate)} BPM**"
         )
         if score_mods:
             mod_text = "\t+"
@@ -259,7 +290,7 @@ class UserNewbest(BaseCog):
         artist = score.beatmapset.artist
         title = score.beatmapset.title
         version = score.beatmap.version
-        embed.title = f"{artist} - {title} [{version}] [{round(calc_result.difficulty.stars, 2)}★]"
+        embed.title = f"{artist} - {title} [{version}] [{round(calc_result.stars, 2)}★]"
 
         rank_key = score.rank.value
 
@@ -280,12 +311,12 @@ class UserNewbest(BaseCog):
         max_combo = score.max_combo
         embed.add_field(
             name=f"** {RANK_EMOJI.get(rank_key, '')}{mod_text}\t{total_score:,}\t({round(accuracy, 4):.2%}) **",
-            value=f"""**{round(pp_value, 2)}**/{round(calc_result.pp, 2)}pp [ **{max_combo}x**/{calc_result.difficulty.max_combo}x ] {{{c300}/{c100}/{c50}/{cmiss}}}
+            value=f"""**{round(pp_value, 2)}**/{round(calc_result.pp, 2)}pp [ **{max_combo}x**/{calc_result.max_combo}x ] {{{c300}/{c100}/{c50}/{cmiss}}}
             {time_text} | {bpm_text}
             <t:{int(scoretime.timestamp())}:R> | Limit: {limit}""",
         )
 
-        await channel.send(embed=embed)
+        await self.bot.dispatcher.send(BOTSPAM_CHANNEL_ID, embed=embed)
 
 
 async def setup(bot: OsuBot) -> None:
@@ -5,6 +5,18 @@ from dotenv import load_dotenv
 
 load_dotenv(override=True)
 
+
+def _env_int(name: str, default: int) -> int:
+    """Read an optional integer setting, empty values fall back to default."""
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_flag(name: str) -> bool:
+    """Read an optional on/off setting, off unless set to 1, true or yes."""
+    return (os.getenv(name) or "").lower() in ("1", "true", "yes")
+
+
 # Discord configuration
 if not (discord_token := os.getenv("DISCORD_TOKEN")):
     raise ValueError("DISCORD_TOKEN environment variable is required")
@@ -37,6 +49,43 @@ DATABASE_URL = (
     else f"postgresql://{postgres_user}:{postgres_password}@db:5432/{postgres_db}"
 )
 
+# country ranking fetched by refresh_roles, 50 players per page
+RANKING_PAGES = 20
+# how many ranking pages may be requested from the osu! API at once
+RANKING_FETCH_CONCURRENCY = _env_int("RANKING_FETCH_CONCURRENCY", 5)
+
+# osu! API requests allowed per minute across the whole bot, see
+# https://osu.ppy.sh/docs/index.html#terms-of-use (60/min recommended)
+OSU_API_REQUESTS_PER_MINUTE = _env_int("OSU_API_REQUESTS_PER_MINUTE", 60)
+# seconds a looked up osu! user is reused before it is fetched again
+OSU_USER_CACHE_TTL = _env_int("OSU_USER_CACHE_TTL", 60)
+# players checked concurrently by user_newbest_loop
+NEWBEST_WORKERS = _env_int("NEWBEST_WORKERS", 4)
+
+# downloaded .osu files used for pp calculation
+BEATMAP_DIR = os.getenv("BEATMAP_DIR") or os.path.join(os.getcwd(), "beatmaps")
+BEATMAP_DIR_MAX_MB = _env_int("BEATMAP_DIR_MAX_MB", 1024)
+# parsed beatmaps kept in memory
+BEATMAP_CACHE_SIZE = _env_int("BEATMAP_CACHE_SIZE", 128)
+
+# where pp calculations run: "process" pool or "thread" pool, and its size
+PP_EXECUTOR = os.getenv("PP_EXECUTOR") or "process"
+PP_WORKERS = _env_int("PP_WORKERS", 2)
+# memoized (beatmap, mods) calculation results kept in memory
+DIFFICULTY_CACHE_SIZE = _env_int("DIFFICULTY_CACHE_SIZE", 1024)
+
+# asyncpg connection pool, timeouts in seconds
+DB_POOL_MIN_SIZE = _env_int("DB_POOL_MIN_SIZE", 2)
+DB_POOL_MAX_SIZE = _env_int("DB_POOL_MAX_SIZE", 10)
+# how long a query may wait for a free connection
+DB_ACQUIRE_TIMEOUT = _env_int("DB_ACQUIRE_TIMEOUT", 10)
+DB_COMMAND_TIMEOUT = _env_int("DB_COMMAND_TIMEOUT", 60)
+# idle connections are closed after this long
+DB_MAX_INACTIVE_LIFETIME = _env_int("DB_MAX_INACTIVE_LIFETIME", 300)
+
+# follow players table changes made by other bot instances (LISTEN/NOTIFY)
+PLAYERS_NOTIFY = _env_flag("PLAYERS_NOTIFY")
+
 POST_REQUEST_URL = os.getenv("POST_REQUEST_URL")
 POST_REQUEST_TOKEN = os.getenv("POST_REQUEST_TOKEN")
 
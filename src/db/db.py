@@ -1,16 +1,38 @@
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any
+
 import asyncpg
-from config import DATABASE_URL
+from config import (
+    DATABASE_URL,
+    DB_ACQUIRE_TIMEOUT,
+    DB_COMMAND_TIMEOUT,
+    DB_MAX_INACTIVE_LIFETIME,
+    DB_POOL_MAX_SIZE,
+    DB_POOL_MIN_SIZE,
+)
+from .migrations import LINK_LOCK_CLASS
 from .schema import ensure_players_table
+from .stats import PoolStats
 
 
 class Database:
     pool: asyncpg.Pool
 
-    # def __init__(self):
-    #     self.pool = None
+    def __init__(self) -> None:
+        self.stats = PoolStats()
 
     async def setup_hook(self) -> None:
-        self.pool = await asyncpg.create_pool(DATABASE_URL, ssl="prefer")
+        self.pool = await asyncpg.create_pool(
+            DATABASE_URL,
+            ssl="prefer",
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            command_timeout=DB_COMMAND_TIMEOUT,
+            max_inactive_connection_lifetime=DB_MAX_INACTIVE_LIFETIME,
+        )
 
         # Ensure players table exists and matches expected schema. If verification
         # fails, raise an exception so the application can shut down safely.
@@ -24,17 +46,133 @@ class Database:
                 pass
             raise
 
-    async def get_user(self, discord_id: int) -> list[asyncpg.Record]:
-        """Get user from database with discord_id"""
-        async with self.pool.acquire() as conn:
-            result = await conn.fetch(
-                "SELECT discord_id FROM players WHERE discord_id = $1;", discord_id
-            )
-            return result
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[asyncpg.pool.PoolConnectionProxy]:
+        """Check out a connection, recording wait time in `stats`.
+
+        Raises TimeoutError if no connection frees up within
+        DB_ACQUIRE_TIMEOUT seconds.
+        """
+        stats = self.stats
+        stats.waiters += 1
+        stats.max_waiters = max(stats.max_waiters, stats.waiters)
+        start = time.perf_counter()
+        try:
+            conn = await self.pool.acquire(timeout=DB_ACQUIRE_TIMEOUT)
+        except TimeoutError:
+            stats.timeouts += 1
+            raise
+        finally:
+            stats.waiters -= 1
+        stats.observe_acquire(time.perf_counter() - start)
+        try:
+            yield conn
+        finally:
+            await self.pool.release(conn)
+
+    # Shortcuts like the pool's own, but through `acquire`.
+
+    async def fetch(self, query: str, *args: Any) -> list[asyncpg.Record]:
+        async with self.acquire() as conn:
+            return await conn.fetch(query, *args)
+
+    async def fetchrow(self, query: str, *args: Any) -> asyncpg.Record | None:
+        async with self.acquire() as conn:
+            return await conn.fetchrow(query, *args)
+
+    async def execute(self, query: str, *args: Any) -> str:
+        async with self.acquire() as conn:
+            return await conn.execute(query, *args)
+
+    # Player queries. Each uses constant SQL text with bind parameters, so
+    # asyncpg prepares it once per connection and reuses the statement.
+
+    async def list_players(self) -> list[asyncpg.Record]:
+        """Return (discord_id, osu_id, last_checked) of every player."""
+        return await self.fetch("SELECT discord_id, osu_id, last_checked FROM players;")
 
-    async def create_user(self, discord_id: int) -> None:
-        """Create new user in database with discord_id"""
-        async with self.pool.acquire() as conn:
+    async def get_players(self, discord_ids: list[int]) -> list[asyncpg.Record]:
+        return await self.fetch(
+            "SELECT discord_id, osu_id, last_checked FROM players WHERE discord_id = ANY($1::bigint[]);",
+            discord_ids,
+        )
+
+    async def add_player(self, discord_id: int) -> bool:
+        """Insert an unlinked player, returns False if it already existed."""
+        status = await self.execute(
+            "INSERT INTO players (discord_id) VALUES ($1) ON CONFLICT DO NOTHING;",
+            discord_id,
+        )
+        return status != "INSERT 0 0"
+
+    async def add_players(self, discord_ids: list[int]) -> list[int]:
+        """Insert unlinked players in one statement, returns the ids inserted."""
+        rows = await self.fetch(
+            """
+            INSERT INTO players (discord_id) SELECT unnest($1::bigint[])
+            ON CONFLICT DO NOTHING RETURNING discord_id;
+            """,
+            discord_ids,
+        )
+        return [row[0] for row in rows]
+
+    async def link_osu_id(self, discord_id: int, osu_id: int) -> int | None:
+        """Link an osu! account to a player, inserting the player if needed.
+
+        If the account was linked to another player it is taken over, the
+        discord id it was taken from is returned. Links of the same account
+        are serialized with an advisory lock, so racing links take it over
+        one after another; the unique index on `osu_id` makes sure no
+        writer can leave it linked twice.
+        """
+        async with self.acquire() as conn, conn.transaction():
+            await conn.execute(
+                "SELECT pg_advisory_xact_lock($1, $2);", LINK_LOCK_CLASS, osu_id
+            )
+            previous = await conn.fetchval(
+                "UPDATE players SET osu_id = NULL WHERE osu_id = $2 AND discord_id <> $1 RETURNING discord_id;",
+                discord_id,
+                osu_id,
+            )
             await conn.execute(
-                "INSERT INTO players (discord_id) VALUES ($1);", discord_id
+                """
+                INSERT INTO players (discord_id, osu_id) VALUES ($1, $2)
+                ON CONFLICT (discord_id) DO UPDATE SET osu_id = EXCLUDED.osu_id;
+                """,
+                discord_id,
+                osu_id,
             )
+        return previous
+
+    async def mark_checked(self, checked: list[tuple[int, datetime]]) -> None:
+        """Set `last_checked` for many players in a single statement.
+
+        `checked` holds (discord_id, last_checked) pairs.
+        """
+        if not checked:
+            return
+        await self.execute(
+            """
+            UPDATE players AS p SET last_checked = u.last_checked
+            FROM unnest($1::bigint[], $2::timestamptz[]) AS u(discord_id, last_checked)
+            WHERE p.discord_id = u.discord_id;
+            """,
+            [discord_id for discord_id, _ in checked],
+            [last_checked for _, last_checked in checked],
+        )
+
+    # Bot state, see migration 3.
+
+    async def get_state(self, key: str) -> str | None:
+        row = await self.fetchrow("SELECT value FROM bot_state WHERE key = $1;", key)
+        return row["value"] if row is not None else None
+
+    async def set_state(self, key: str, value: str) -> None:
+        await self.execute(
+            """
+            INSERT INTO bot_state (key, value) VALUES ($1, $2)
+            ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, updated_at = now();
+            """,
+            key,
+            value,
+        )
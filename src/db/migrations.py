@@ -0,0 +1,157 @@
+"""Versioned schema migrations.
+
+`CREATE_PLAYERS_TABLE` in `schema.py` is the baseline schema. Changes after
+it are listed in `MIGRATIONS` as (version, name, sql) steps, applied in
+order and recorded in the `schema_migrations` table. Each step runs in its
+own transaction, after its hook in `MIGRATION_HOOKS`, if it has one.
+
+Bootstrap runs under a Postgres advisory lock, so replicas starting at the
+same time apply every step exactly once.
+"""
+
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+
+import asyncpg
+from loguru import logger
+
+CREATE_MIGRATIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+"""
+
+# arbitrary application-wide key for pg_advisory_lock
+SCHEMA_LOCK_KEY = 7_358_421_001
+# first key of the per osu! id advisory locks taken by Database.link_osu_id
+LINK_LOCK_CLASS = 7_358_421
+
+# an osu! account can only be linked to one member, duplicates left by
+# earlier races keep the most recently checked link. Lists the links that
+# lose their osu_id and the member keeping it.
+DUPLICATE_LINKS = """
+SELECT discord_id, osu_id, kept_by FROM (
+    SELECT discord_id, osu_id,
+        row_number() OVER links AS n,
+        first_value(discord_id) OVER links AS kept_by
+    FROM players WHERE osu_id IS NOT NULL
+    WINDOW links AS (
+        PARTITION BY osu_id
+        ORDER BY last_checked DESC NULLS LAST, discord_id
+    )
+) AS linked
+WHERE n > 1
+"""
+
+MIGRATIONS: list[tuple[int, str, str]] = [
+    (
+        1,
+        "players.last_checked to timestamptz",
+        """
+        ALTER TABLE players
+        ALTER COLUMN last_checked TYPE TIMESTAMPTZ
+        USING NULLIF(last_checked, '')::timestamptz;
+        """,
+    ),
+    (
+        2,
+        "unique players.osu_id",
+        f"""
+        UPDATE players SET osu_id = NULL
+        WHERE discord_id IN (SELECT discord_id FROM ({DUPLICATE_LINKS}) AS duplicate);
+        CREATE UNIQUE INDEX IF NOT EXISTS players_osu_id_key
+        ON players (osu_id) WHERE osu_id IS NOT NULL;
+        """,
+    ),
+    (
+        3,
+        "bot_state",
+        # small key/value store for bot bookkeeping, e.g. command tree hashes
+        """
+        CREATE TABLE IF NOT EXISTS bot_state (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        """,
+    ),
+    (
+        4,
+        "beatmap_attributes",
+        # memoized pp calculation results, see pp.DifficultyCache. Older
+        # versions created it outside migrations, hence IF NOT EXISTS.
+        """
+        CREATE TABLE IF NOT EXISTS beatmap_attributes (
+            beatmap_id INTEGER NOT NULL,
+            mods TEXT NOT NULL,
+            checksum TEXT NOT NULL,
+            stars DOUBLE PRECISION NOT NULL,
+            max_combo INTEGER NOT NULL,
+            fc_pp DOUBLE PRECISION NOT NULL,
+            clock_rate DOUBLE PRECISION NOT NULL,
+            PRIMARY KEY (beatmap_id, mods)
+        );
+        """,
+    ),
+]
+
+
+async def log_duplicate_links(
+    conn: asyncpg.Connection | asyncpg.pool.PoolConnectionProxy,
+) -> None:
+    """Log the links migration 2 removes, so they can be restored by hand."""
+    for row in await conn.fetch(DUPLICATE_LINKS):
+        logger.warning(
+            f"Unlinking discord id {row['discord_id']} from osu! id {row['osu_id']}, "
+            f"the account stays linked to discord id {row['kept_by']}"
+        )
+
+
+# run before a migration's sql, in the same transaction
+MIGRATION_HOOKS: dict[
+    int,
+    Callable[[asyncpg.Connection | asyncpg.pool.PoolConnectionProxy], Awaitable[None]],
+] = {2: log_duplicate_links}
+
+
+@asynccontextmanager
+async def schema_lock(
+    conn: asyncpg.Connection | asyncpg.pool.PoolConnectionProxy,
+) -> AsyncIterator[None]:
+    """Hold the schema advisory lock for the duration of the block."""
+    await conn.execute("SELECT pg_advisory_lock($1);", SCHEMA_LOCK_KEY)
+    try:
+        yield
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1);", SCHEMA_LOCK_KEY)
+
+
+async def run_migrations(
+    conn: asyncpg.Connection | asyncpg.pool.PoolConnectionProxy,
+) -> None:
+    """Apply pending migrations in version order.
+
+    Must be called while holding `schema_lock`.
+    """
+    await conn.execute(CREATE_MIGRATIONS_TABLE)
+    applied = {
+        row["version"]
+        for row in await conn.fetch("SELECT version FROM schema_migrations;")
+    }
+
+    for version, name, sql in sorted(MIGRATIONS):
+        if version in applied:
+            continue
+        async with conn.transaction():
+            hook = MIGRATION_HOOKS.get(version)
+            if hook is not None:
+                await hook(conn)
+            await conn.execute(sql)
+            await conn.execute(
+                "INSERT INTO schema_migrations (version, name) VALUES ($1, $2);",
+                version,
+                name,
+            )
+        logger.info(f"Applied database migration {version}: {name}")
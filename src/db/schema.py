@@ -5,15 +5,20 @@ provides functions to create it if missing and verify its structure.
 
 Behavior:
 - If the table is missing, `ensure_players_table` will create it.
+- Pending migrations from `migrations.py` are applied on top of it.
 - If the table exists, `verify_players_table` will check that required
-  columns exist with compatible types. On mismatch, verification fails
-  and raises `RuntimeError` so the application can exit safely.
+  columns exist with compatible types and that the expected indexes
+  exist. On mismatch, verification fails and raises `RuntimeError` so
+  the application can exit safely.
 """
 
 from typing import Dict
 import asyncpg
 
+from .migrations import run_migrations, schema_lock
 
+
+# baseline schema, later changes are applied by migrations
 CREATE_PLAYERS_TABLE = """
 CREATE TABLE IF NOT EXISTS players (
     discord_id BIGINT PRIMARY KEY,
@@ -26,30 +31,39 @@ CREATE TABLE IF NOT EXISTS players (
 EXPECTED_COLUMNS: Dict[str, str] = {
     "discord_id": "bigint",
     "osu_id": "integer",
-    "last_checked": "text",
+    "last_checked": "timestamp with time zone",
 }
 
+# unique indexes the linking queries rely on, created by migrations
+EXPECTED_UNIQUE_INDEXES = ["players_osu_id_key"]
+
 
 async def ensure_players_table(pool: asyncpg.Pool) -> None:
     """Ensure the `players` table exists and has the expected columns.
 
     - Creates the table if it does not exist.
+    - Applies pending migrations.
     - Verifies the existing table's columns match expected types.
 
     Raises RuntimeError on verification failure.
     """
     async with pool.acquire() as conn:
-        # create table if not exists (safe for existing DBs)
-        await conn.execute(CREATE_PLAYERS_TABLE)
+        async with schema_lock(conn):
+            # create table if not exists (safe for existing DBs)
+            await conn.execute(CREATE_PLAYERS_TABLE)
+            await run_migrations(conn)
 
         # verify schema
         await verify_players_table(conn)
 
 
-async def verify_players_table(conn: asyncpg.Connection) -> None:
-    """Verify that the `players` table has the expected columns.
+async def verify_players_table(
+    conn: asyncpg.Connection | asyncpg.pool.PoolConnectionProxy,
+) -> None:
+    """Verify that the `players` table has the expected columns and indexes.
 
-    Uses `information_schema.columns` to obtain the column data types.
+    Uses `information_schema.columns` to obtain the column data types and
+    `pg_indexes` to look up the index definitions.
     Raises RuntimeError with a descriptive message on mismatch.
     """
     rows = await conn.fetch(
@@ -80,6 +94,20 @@ async def verify_players_table(conn: asyncpg.Connection) -> None:
                 f"column {col} has type {actual}, expected {expected_type}"
             )
 
+    index_rows = await conn.fetch(
+        """
+        SELECT indexname, indexdef
+        FROM pg_indexes
+        WHERE tablename = 'players' AND schemaname = 'public'
+        """
+    )
+    indexes = {r["indexname"]: r["indexdef"] for r in index_rows}
+    for index in EXPECTED_UNIQUE_INDEXES:
+        if index not in indexes:
+            mismatches.append(f"missing index: {index}")
+        elif not indexes[index].startswith("CREATE UNIQUE INDEX"):
+            mismatches.append(f"index {index} is not unique")
+
     if mismatches:
         msg = (
             "players table schema mismatch:\n"
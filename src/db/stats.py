@@ -0,0 +1,50 @@
+"""Connection pool health metrics reported by `/db_stats`."""
+
+import bisect
+
+import asyncpg
+
+# upper bounds of the acquire latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+class PoolStats:
+    """Counters updated by `Database.acquire`."""
+
+    def __init__(self) -> None:
+        # callers currently waiting for a connection
+        self.waiters = 0
+        self.max_waiters = 0
+        self.acquired = 0
+        self.timeouts = 0
+        self.max_latency = 0.0
+        self.latency_histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def observe_acquire(self, seconds: float) -> None:
+        self.acquired += 1
+        self.max_latency = max(self.max_latency, seconds)
+        self.latency_histogram[
+            bisect.bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)
+        ] += 1
+
+    def describe(self, pool: asyncpg.Pool) -> str:
+        """Render the pool state and counters as a short report."""
+        size = pool.get_size()
+        idle = pool.get_idle_size()
+        lines = [
+            f"pool size {size} (min {pool.get_min_size()}, max {pool.get_max_size()})",
+            f"in use {size - idle}, idle {idle}",
+            f"waiters {self.waiters} (max {self.max_waiters})",
+            f"acquired {self.acquired}, timed out {self.timeouts}, "
+            f"slowest {self.max_latency * 1000:.1f} ms",
+            "acquire latency:",
+        ]
+        lower = 0
+        for upper, count in zip(
+            (*LATENCY_BUCKETS_MS, None), self.latency_histogram, strict=True
+        ):
+            label = f"{lower}-{upper} ms" if upper is not None else f">{lower} ms"
+            lines.append(f"  {label:>12}: {count}")
+            if upper is not None:
+                lower = upper
+        return "\n".join(lines)
@@ -0,0 +1,164 @@
+"""Outbound Discord message dispatcher.
+
+Producers call `ChannelDispatcher.send`, which only puts the message on the
+channel's queue and returns. One worker per channel sends queued messages
+under a per channel rate limit, packing consecutive embeds into a single
+message where Discord allows it. Queues are bounded: when a channel falls
+behind, `send` waits for room instead of the backlog growing without end.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass
+
+import discord
+from discord.utils import MISSING
+from loguru import logger
+
+from ratelimit import TokenBucket
+
+# Discord limits for a single message
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_EMBED_CHARS_PER_MESSAGE = 6000
+
+
+@dataclass(slots=True)
+class OutgoingMessage:
+    content: str | None = None
+    embed: discord.Embed | None = None
+    allowed_mentions: discord.AllowedMentions | None = None
+
+
+class ChannelStats:
+    def __init__(self) -> None:
+        self.enqueued = 0
+        self.messages = 0
+        self.embeds = 0
+        self.failures = 0
+        self.max_send_latency = 0.0
+
+
+class ChannelDispatcher:
+    QUEUE_SIZE = 200
+    # Discord allows about 5 messages per 5 seconds per channel
+    MESSAGES_PER_WINDOW = 5
+    WINDOW_SECONDS = 5.0
+    # how long close() waits for queued messages to go out
+    DRAIN_TIMEOUT = 5.0
+
+    def __init__(self, client: discord.Client) -> None:
+        self.client = client
+        self._queues: dict[int, asyncio.Queue[OutgoingMessage]] = {}
+        self._workers: dict[int, asyncio.Task[None]] = {}
+        self.stats: dict[int, ChannelStats] = {}
+
+    async def send(
+        self,
+        channel_id: int,
+        content: str | None = None,
+        *,
+        embed: discord.Embed | None = None,
+        allowed_mentions: discord.AllowedMentions | None = None,
+    ) -> None:
+        """Queue a message for `channel_id`, waits only if its queue is full."""
+        if content is None and embed is None:
+            raise ValueError("message needs content or an embed")
+        queue = self._queues.get(channel_id)
+        if queue is None:
+            queue = self._queues[channel_id] = asyncio.Queue(self.QUEUE_SIZE)
+            self.stats[channel_id] = ChannelStats()
+            self._workers[channel_id] = asyncio.create_task(
+                self._worker(channel_id, queue)
+            )
+        await queue.put(OutgoingMessage(content, embed, allowed_mentions))
+        self.stats[channel_id].enqueued += 1
+
+    async def close(self) -> None:
+        """Give queued messages a moment to go out, then stop the workers."""
+        try:
+            async with asyncio.timeout(self.DRAIN_TIMEOUT):
+                for queue in self._queues.values():
+                    await queue.join()
+        except TimeoutError:
+            logger.warning("dispatcher closed with messages still queued")
+        for worker in self._workers.values():
+            worker.cancel()
+
+    async def _worker(
+        self, channel_id: int, queue: asyncio.Queue[OutgoingMessage]
+    ) -> None:
+        limiter = TokenBucket(self.MESSAGES_PER_WINDOW, per=self.WINDOW_SECONDS)
+        stats = self.stats[channel_id]
+        # message taken from the queue that did not fit the previous batch
+        carry: OutgoingMessage | None = None
+        while True:
+            if carry is None:
+                first = await queue.get()
+            else:
+                first, carry = carry, None
+            batch = [first]
+            await limiter.acquire()
+            # pack embeds that queued up meanwhile, as long as they fit
+            if first.content is None and first.embed is not None:
+                chars = len(first.embed)
+                while len(batch) < MAX_EMBEDS_PER_MESSAGE and not queue.empty():
+                    message = queue.get_nowait()
+                    if (
+                        message.content is not None
+                        or message.embed is None
+                        or chars + len(message.embed) > MAX_EMBED_CHARS_PER_MESSAGE
+                    ):
+                        carry = message
+                        break
+                    chars += len(message.embed)
+                    batch.append(message)
+
+            start = time.perf_counter()
+            try:
+                await self._deliver(channel_id, batch)
+                stats.messages += 1
+                stats.embeds += sum(1 for message in batch if message.embed)
+            except Exception:
+                stats.failures += 1
+                logger.exception(f"error sending message to channel {channel_id}")
+            finally:
+                stats.max_send_latency = max(
+                    stats.max_send_latency, time.perf_counter() - start
+                )
+                for _ in batch:
+                    queue.task_done()
+
+    async def _deliver(self, channel_id: int, batch: list[OutgoingMessage]) -> None:
+        channel = self.client.get_channel(channel_id)
+        if not isinstance(channel, discord.TextChannel):
+            raise ValueError(f"Channel {channel_id} not found or is not a text channel")
+        first = batch[0]
+        if first.content is not None:
+            # send() takes MISSING, not None, for options that aren't set
+            await channel.send(
+                first.content,
+                embed=first.embed if first.embed is not None else MISSING,
+                allowed_mentions=(
+                    first.allowed_mentions
+                    if first.allowed_mentions is not None
+                    else MISSING
+                ),
+            )
+        else:
+            await channel.send(
+                embeds=[message.embed for message in batch if message.embed]
+            )
+
+    def describe(self) -> str:
+        """Render per channel queue depth and counters as a short report."""
+        if not self.stats:
+            return "No messages sent yet."
+        lines = []
+        for channel_id, stats in self.stats.items():
+            lines.append(
+                f"{channel_id}: queued {self._queues[channel_id].qsize()}, "
+                f"enqueued {stats.enqueued}, sent {stats.messages} message(s) "
+                f"with {stats.embeds} embed(s), {stats.failures} failed, "
+                f"slowest send {stats.max_send_latency * 1000:.0f} ms"
+            )
+        return "\n".join(lines)
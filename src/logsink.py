@@ -0,0 +1,107 @@
+"""Shipping WARNING and above log records to the bot channel.
+
+`DiscordLogSink` is a loguru sink. Records may be emitted from any thread;
+they are buffered and the drain loop in `run` is woken up through the
+event loop. Each wake up waits a short window so a burst of records is
+shipped together, packed into as few messages as fit Discord's 2000
+character limit. Records repeating the same message and exception within
+a window are sent once with a count, and the buffer is bounded: records
+beyond it are dropped and reported as a count.
+"""
+
+import asyncio
+import sys
+import threading
+from collections.abc import Awaitable, Callable
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from loguru import Message
+
+# code block fences around each message: "```\n" + "\n```"
+FENCE_LENGTH = 8
+MAX_MESSAGE_LENGTH = 2000
+
+
+class DiscordLogSink:
+    MAX_RECORDS = 500
+    # seconds to collect further records after the first one arrives
+    WINDOW = 0.5
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # (level, message, exception) -> [rendered record, count]
+        self._records: dict[tuple[str, str, str], list[str | int]] = {}
+        self._dropped = 0
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wakeup = asyncio.Event()
+
+    def __call__(self, message: "Message") -> None:
+        record = message.record
+        exception = record["exception"]
+        key = (
+            record["level"].name,
+            record["message"],
+            f"{exception.type!r}: {exception.value}" if exception else "",
+        )
+        with self._lock:
+            entry = self._records.get(key)
+            if entry is not None:
+                entry[1] = int(entry[1]) + 1
+            elif len(self._records) >= self.MAX_RECORDS:
+                self._dropped += 1
+            else:
+                self._records[key] = [str(message).strip(), 1]
+            loop = self._loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self._wakeup.set)
+            except RuntimeError:
+                # event loop already closed
+                pass
+
+    async def run(self, send: Callable[[str], Awaitable[None]]) -> None:
+        """Ship buffered records with `send` whenever new ones arrive."""
+        self._loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._records or self._dropped:
+                self._wakeup.set()
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.WINDOW)
+            self._wakeup.clear()
+            for chunk in self._take():
+                try:
+                    await send(chunk)
+                except Exception as e:
+                    # Log to stderr if Discord logging fails to avoid infinite loop
+                    print(f"Error sending log to Discord: {e}", file=sys.stderr)
+
+    def _take(self) -> list[str]:
+        """Empty the buffer and pack its records into message contents."""
+        with self._lock:
+            records, self._records = self._records, {}
+            dropped, self._dropped = self._dropped, 0
+
+        limit = MAX_MESSAGE_LENGTH - FENCE_LENGTH
+        texts: list[str] = []
+        for text, count in records.values():
+            suffix = f"\n(x{count})" if int(count) > 1 else ""
+            text = str(text)
+            if len(text) + len(suffix) > limit:
+                text = text[: limit - len(suffix) - 3] + "..."
+            texts.append(text + suffix)
+        if dropped:
+            texts.append(f"... {dropped} log record(s) dropped")
+
+        chunks: list[str] = []
+        current = ""
+        for text in texts:
+            if current and len(current) + 1 + len(text) > limit:
+                chunks.append(current)
+                current = text
+            else:
+                current = f"{current}\n{text}" if current else text
+        if current:
+            chunks.append(current)
+        return [f"```\n{chunk}\n```" for chunk in chunks]
@@ -0,0 +1,209 @@
+"""Gateway in front of the osu! API client.
+
+Every osu! API call of the bot goes through `OsuApi`, which
+
+- spends a token from one bot wide `TokenBucket` per request, served by
+  `Priority` so interactive commands are not stuck behind background loops,
+- retries rate limited (429), server side (5xx) and connection failures
+  with jittered exponential backoff,
+- keeps per endpoint call, error and latency counters,
+- caches user lookups for a short time and lets concurrent identical
+  lookups share one request.
+
+ossapi does not check response status codes: error responses surface as
+`ValueError` (JSON error bodies) or aiohttp exceptions carrying `.status`
+(non JSON bodies), which `is_retryable` tells apart.
+"""
+
+import asyncio
+import random
+import time
+from collections.abc import Awaitable, Callable
+from enum import IntEnum
+
+import aiohttp
+from loguru import logger
+from ossapi import Cursor, GameMode, OssapiAsync, RankingType, ScoreType, UserLookupKey
+from ossapi.models import Rankings, Score, User
+
+from cache import TTLCache
+from ratelimit import TokenBucket
+
+type UserKey = tuple[UserLookupKey, int | str, GameMode]
+
+
+class Priority(IntEnum):
+    """Request priority classes, lower values are served first."""
+
+    INTERACTIVE = 0
+    DEFAULT = 1
+    BACKGROUND = 2
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether a failed request is worth retrying."""
+    status = getattr(error, "status", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    if isinstance(error, (aiohttp.ClientConnectionError, asyncio.TimeoutError)):
+        return True
+    # rate limit responses with a JSON body
+    return isinstance(error, ValueError) and "too many" in str(error).lower()
+
+
+class EndpointStats:
+    def __init__(self) -> None:
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.calls += 1
+        self.total_latency += seconds
+        self.max_latency = max(self.max_latency, seconds)
+
+
+class OsuApi:
+    MAX_RETRIES = 4
+    BACKOFF_BASE = 1.0
+    BACKOFF_MAX = 30.0
+    USER_CACHE_SIZE = 2048
+
+    def __init__(
+        self, api: OssapiAsync, requests_per_minute: int, user_cache_ttl: float
+    ) -> None:
+        self.api = api
+        self.limiter = TokenBucket(requests_per_minute, per=60)
+        self.stats: dict[str, EndpointStats] = {}
+        self._users: TTLCache[UserKey, User] = TTLCache(
+            self.USER_CACHE_SIZE, ttl=user_cache_ttl
+        )
+        self._user_requests: dict[UserKey, asyncio.Task[User]] = {}
+
+    async def call[T](
+        self,
+        endpoint: str,
+        request: Callable[[], Awaitable[T]],
+        priority: Priority = Priority.DEFAULT,
+    ) -> T:
+        """Run `request` under the rate limit, retrying transient failures."""
+        stats = self.stats.setdefault(endpoint, EndpointStats())
+        attempt = 0
+        while True:
+            await self.limiter.acquire(priority=priority)
+            start = time.perf_counter()
+            try:
+                result = await request()
+            except Exception as e:
+                stats.observe(time.perf_counter() - start)
+                stats.errors += 1
+                if attempt >= self.MAX_RETRIES or not is_retryable(e):
+                    raise
+                # full jitter, see https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
+                delay = random.uniform(
+                    0, min(self.BACKOFF_MAX, self.BACKOFF_BASE * 2**attempt)
+                )
+                attempt += 1
+                stats.retries += 1
+                logger.info(
+                    f"osu! API {endpoint} failed ({e!r}), retry {attempt} in {delay:.1f}s"
+                )
+                await asyncio.sleep(delay)
+                continue
+            stats.observe(time.perf_counter() - start)
+            return result
+
+    async def user(
+        self,
+        user: int | str,
+        *,
+        mode: GameMode,
+        key: UserLookupKey,
+        priority: Priority = Priority.DEFAULT,
+    ) -> User:
+        """Look up a user, answered from a short lived cache.
+
+        Concurrent lookups of the same user share one request, the first
+        caller's priority is used for it.
+        """
+        cache_key: UserKey = (
+            key,
+            user.lower() if isinstance(user, str) else user,
+            mode,
+        )
+        hit, cached = self._users.get(cache_key)
+        if hit and cached is not None:
+            return cached
+
+        task = self._user_requests.get(cache_key)
+        if task is None:
+            task = asyncio.create_task(
+                self.call(
+                    "user", lambda: self.api.user(user, mode=mode, key=key), priority
+                )
+            )
+            self._user_requests[cache_key] = task
+            task.add_done_callback(lambda t: self._user_done(cache_key, t))
+        # one waiter being cancelled must not cancel the others' request
+        return await asyncio.shield(task)
+
+    def _user_done(self, cache_key: UserKey, task: asyncio.Task[User]) -> None:
+        del self._user_requests[cache_key]
+        # also marks the exception as retrieved if every waiter is gone
+        if not task.cancelled() and task.exception() is None:
+            self._users.set(cache_key, task.result())
+
+    async def user_scores(
+        self,
+        user_id: int,
+        *,
+        type: ScoreType,
+        mode: GameMode,
+        limit: int,
+        include_fails: bool = False,
+        priority: Priority = Priority.DEFAULT,
+    ) -> list[Score]:
+        return await self.call(
+            "user_scores",
+            lambda: self.api.user_scores(
+                user_id,
+                type=type,
+                include_fails=include_fails,
+                limit=limit,
+                mode=mode,
+            ),
+            priority,
+        )
+
+    async def ranking(
+        self,
+        mode: GameMode,
+        type: RankingType,
+        *,
+        country: str | None = None,
+        cursor: Cursor | None = None,
+        priority: Priority = Priority.DEFAULT,
+    ) -> Rankings:
+        return await self.call(
+            "ranking",
+            lambda: self.api.ranking(mode, type, country=country, cursor=cursor),
+            priority,
+        )
+
+    def describe(self) -> str:
+        """Render the per endpoint counters as a short report."""
+        lines = [
+            f"rate limit queue: {self.limiter.waiting} waiting",
+            f"user cache: {len(self._users)} entries, "
+            f"{self._users.hits} hits, {self._users.misses} misses",
+        ]
+        for endpoint, stats in sorted(self.stats.items()):
+            average = stats.total_latency / stats.calls if stats.calls else 0.0
+            lines.append(
+                f"{endpoint}: {stats.calls} calls, {stats.errors} errors, "
+                f"{stats.retries} retries, avg {average * 1000:.0f} ms, "
+                f"max {stats.max_latency * 1000:.0f} ms"
+            )
+        return "\n".join(lines)
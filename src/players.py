@@ -0,0 +1,261 @@
+"""In-memory mirror of the `players` table.
+
+`PlayerRegistry` loads every row once at startup and keeps indexes by
+discord id and osu! id, so cogs resolve players with dictionary lookups
+instead of querying Postgres. All writes go through the registry, which
+writes them to the database first and then updates the indexes.
+
+When several bot instances share a database, `listen` keeps the mirror
+consistent: every write is announced with NOTIFY and the other instances
+reload the changed rows.
+"""
+
+import asyncio
+import uuid
+from collections.abc import Iterable, KeysView
+from dataclasses import dataclass, replace
+from datetime import datetime
+
+import asyncpg
+from loguru import logger
+
+from db.db import Database
+
+# ids per NOTIFY payload, payloads are limited to 8000 bytes
+NOTIFY_CHUNK_SIZE = 300
+
+
+@dataclass(frozen=True, slots=True)
+class Player:
+    discord_id: int
+    osu_id: int | None
+    last_checked: datetime | None
+
+
+class PlayerRegistry:
+    CHANNEL = "players_changed"
+    # longest wait between LISTEN reconnect attempts, in seconds
+    RECONNECT_MAX_DELAY = 60.0
+
+    def __init__(self, db: Database) -> None:
+        self.db = db
+        self._by_discord_id: dict[int, Player] = {}
+        self._by_osu_id: dict[int, Player] = {}
+        # tags our own notifications so they are not reloaded again
+        self._instance_id = uuid.uuid4().hex
+        # set while following other instances' changes
+        self._dsn: str | None = None
+        self._listener: asyncpg.Connection | None = None
+        self._reloads: set[asyncio.Task[None]] = set()
+        # discord ids changed in memory while `load` reads its snapshot
+        self._changed_during_load: set[int] | None = None
+
+    async def load(self) -> None:
+        """Replace the mirror with the current contents of the table.
+
+        Players written while the snapshot is read keep their in-memory
+        values, the snapshot may predate those writes.
+        """
+        self._changed_during_load = changed = set()
+        try:
+            rows = await self.db.list_players()
+        finally:
+            self._changed_during_load = None
+        newer = [
+            player
+            for discord_id in changed
+            if (player := self._by_discord_id.get(discord_id)) is not None
+        ]
+        self._by_discord_id.clear()
+        self._by_osu_id.clear()
+        for row in rows:
+            if row[0] not in changed:
+                self._put(Player(row[0], row[1], row[2]))
+        for player in newer:
+            self._put(player)
+        logger.info(f"Loaded {len(self._by_discord_id)} player(s)")
+
+    def get(self, discord_id: int) -> Player | None:
+        return self._by_discord_id.get(discord_id)
+
+    def by_osu_id(self, osu_id: int) -> Player | None:
+        return self._by_osu_id.get(osu_id)
+
+    def linked(self) -> list[Player]:
+        """Players with a linked osu! account."""
+        return list(self._by_osu_id.values())
+
+    def discord_ids(self) -> KeysView[int]:
+        return self._by_discord_id.keys()
+
+    def __contains__(self, discord_id: int) -> bool:
+        return discord_id in self._by_discord_id
+
+    def __len__(self) -> int:
+        return len(self._by_discord_id)
+
+    async def add(self, discord_id: int) -> bool:
+        """Add an unlinked player, returns False if it already existed."""
+        if discord_id in self._by_discord_id:
+            return False
+        if not await self.db.add_player(discord_id):
+            # added by another instance, pick up its row
+            await self._reload([discord_id])
+            return False
+        self._put(Player(discord_id, None, None))
+        await self._notify([discord_id])
+        return True
+
+    async def add_many(self, discord_ids: Iterable[int]) -> list[int]:
+        """Add unlinked players in one statement, returns the ids inserted."""
+        new = [i for i in set(discord_ids) if i not in self._by_discord_id]
+        if not new:
+            return []
+        added = await self.db.add_players(new)
+        for discord_id in added:
+            self._put(Player(discord_id, None, None))
+        if len(added) < len(new):
+            # the rest were added by another instance
+            await self._reload(list(set(new) - set(added)))
+        await self._notify(added)
+        return added
+
+    async def link(self, discord_id: int, osu_id: int) -> int | None:
+        """Link a player to an osu! account, see `Database.link_osu_id`.
+
+        Returns the discord id the account was taken over from, if any.
+        """
+        previous = await self.db.link_osu_id(discord_id, osu_id)
+        changed = [discord_id]
+        if previous is not None:
+            self._set_osu_id(previous, None)
+            changed.append(previous)
+        player = self._by_discord_id.get(discord_id)
+        if player is None:
+            self._put(Player(discord_id, osu_id, None))
+        else:
+            self._put(replace(player, osu_id=osu_id))
+        await self._notify(changed)
+        return previous
+
+    async def mark_checked(self, checked: list[tuple[int, datetime]]) -> None:
+        """Set `last_checked` for many players, see `Database.mark_checked`."""
+        if not checked:
+            return
+        await self.db.mark_checked(checked)
+        for discord_id, last_checked in checked:
+            player = self._by_discord_id.get(discord_id)
+            if player is not None:
+                self._put(replace(player, last_checked=last_checked))
+        await self._notify([discord_id for discord_id, _ in checked])
+
+    async def listen(self, dsn: str) -> None:
+        """Follow changes made by other instances on a dedicated connection.
+
+        If the connection drops, it is reopened and the mirror reloaded.
+        """
+        self._dsn = dsn
+        await self._connect_listener(dsn)
+
+    async def close(self) -> None:
+        self._dsn = None
+        for task in self._reloads:
+            task.cancel()
+        if self._listener is not None:
+            listener, self._listener = self._listener, None
+            await listener.close()
+
+    async def _connect_listener(self, dsn: str) -> None:
+        listener = await asyncpg.connect(dsn, ssl="prefer")
+        await listener.add_listener(self.CHANNEL, self._on_notify)
+        listener.add_termination_listener(self._on_listener_terminated)
+        self._listener = listener
+        try:
+            # notifications sent while not listening would be missed otherwise
+            await self.load()
+        except BaseException:
+            self._listener = None
+            await listener.close()
+            raise
+
+    def _on_listener_terminated(self, conn: asyncpg.Connection) -> None:
+        # closed by `close`, or already replaced
+        if conn is not self._listener:
+            return
+        self._listener = None
+        logger.warning("players LISTEN connection lost, reconnecting")
+        task = asyncio.create_task(self._reconnect())
+        self._reloads.add(task)
+        task.add_done_callback(self._reloads.discard)
+
+    async def _reconnect(self) -> None:
+        delay = 1.0
+        while (dsn := self._dsn) is not None:
+            try:
+                await self._connect_listener(dsn)
+                logger.info("players LISTEN connection restored")
+                return
+            except Exception:
+                logger.exception(
+                    f"players LISTEN reconnect failed, retrying in {delay:.0f}s"
+                )
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.RECONNECT_MAX_DELAY)
+
+    def _put(self, player: Player) -> None:
+        if self._changed_during_load is not None:
+            self._changed_during_load.add(player.discord_id)
+        old = self._by_discord_id.get(player.discord_id)
+        if old is not None and old.osu_id is not None:
+            if self._by_osu_id.get(old.osu_id) is old:
+                del self._by_osu_id[old.osu_id]
+        self._by_discord_id[player.discord_id] = player
+        if player.osu_id is not None:
+            self._by_osu_id[player.osu_id] = player
+
+    def _drop(self, discord_id: int) -> None:
+        if self._changed_during_load is not None:
+            self._changed_during_load.add(discord_id)
+        old = self._by_discord_id.pop(discord_id, None)
+        if old is not None and old.osu_id is not None:
+            if self._by_osu_id.get(old.osu_id) is old:
+                del self._by_osu_id[old.osu_id]
+
+    def _set_osu_id(self, discord_id: int, osu_id: int | None) -> None:
+        player = self._by_discord_id.get(discord_id)
+        if player is None:
+            return
+        self._put(replace(player, osu_id=osu_id))
+
+    async def _notify(self, discord_ids: Iterable[int]) -> None:
+        # announced through the pool, so also while the listener reconnects
+        if self._dsn is None:
+            return
+        ids = [str(discord_id) for discord_id in discord_ids]
+        for start in range(0, len(ids), NOTIFY_CHUNK_SIZE):
+            payload = f"{self._instance_id}:{','.join(ids[start : start + NOTIFY_CHUNK_SIZE])}"
+            await self.db.execute("SELECT pg_notify($1, $2);", self.CHANNEL, payload)
+
+    def _on_notify(
+        self, conn: asyncpg.Connection, pid: int, channel: str, payload: str
+    ) -> None:
+        instance_id, _, ids = payload.partition(":")
+        if instance_id == self._instance_id or not ids:
+            return
+        task = asyncio.create_task(self._reload([int(i) for i in ids.split(",")]))
+        self._reloads.add(task)
+        task.add_done_callback(self._reloads.discard)
+
+    async def _reload(self, discord_ids: list[int]) -> None:
+        try:
+            rows = await self.db.get_players(discord_ids)
+        except Exception:
+            logger.exception("error reloading changed players")
+            return
+        found = set()
+        for row in rows:
+            self._put(Player(row[0], row[1], row[2]))
+            found.add(row[0])
+        for discord_id in discord_ids:
+            if discord_id not in found:
+                self._drop(discord_id)
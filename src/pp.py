@@ -0,0 +1,228 @@
+"""pp and difficulty calculation with rosu-pp, run off the event loop.
+
+Parsing a beatmap and calculating its difficulty is CPU-bound and can take
+a noticeable time on long maps, so `PpCalculator` runs it in an executor:
+
+- "process" (default): a `ProcessPoolExecutor`. Parsed beatmaps can't be
+  pickled, so workers get the `.osu` path and keep their own small cache
+  of parsed beatmaps.
+- "thread": a `ThreadPoolExecutor` working on beatmaps parsed by the
+  shared `BeatmapStore`.
+
+Results are memoized by `DifficultyCache`, keyed by beatmap id and the
+normalized mod acronyms: an in-memory LRU in front of the
+`beatmap_attributes` table, so the cache survives restarts. Entries are
+stored with the `.osu` checksum and ignored once the map changes.
+
+`rosu_pp_py` is imported on first calculation rather than at startup.
+"""
+
+import asyncio
+import multiprocessing
+import os
+from collections import OrderedDict
+from collections.abc import Iterable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from beatmaps import BeatmapStore
+from db.db import Database
+
+if TYPE_CHECKING:
+    from rosu_pp_py import Beatmap, GameMods
+
+
+@dataclass(frozen=True, slots=True)
+class PpJob:
+    beatmap_id: int
+    mods: tuple[str, ...] = ()
+
+
+@dataclass(frozen=True, slots=True)
+class PpResult:
+    stars: float
+    max_combo: int
+    # pp for a full combo SS with the given mods
+    pp: float
+    clock_rate: float
+
+
+def normalize_mods(acronyms: Iterable[str]) -> tuple[str, ...]:
+    """Return mod acronyms deduplicated, uppercased and in a stable order."""
+    return tuple(sorted({acronym.upper() for acronym in acronyms}))
+
+
+def calculate(beatmap: "Beatmap", mods: tuple[str, ...]) -> PpResult:
+    """Calculate difficulty and FC pp of a parsed beatmap with `mods`."""
+    from rosu_pp_py import BeatmapAttributesBuilder, Performance
+
+    mod_list: "GameMods" = [{"acronym": acronym} for acronym in mods]
+
+    perf = Performance(lazer=False)
+    perf.set_mods(mods=mod_list)
+    calc_result = perf.calculate(beatmap)
+
+    mapattr = BeatmapAttributesBuilder()
+    mapattr.set_map(beatmap)
+    mapattr.set_mods(mod_list)
+    map_attrs = mapattr.build()
+
+    return PpResult(
+        stars=calc_result.difficulty.stars,
+        max_combo=calc_result.difficulty.max_combo,
+        pp=calc_result.pp,
+        clock_rate=map_attrs.clock_rate,
+    )
+
+
+@lru_cache(maxsize=32)
+def _parse_file(path: str, mtime_ns: int) -> "Beatmap":
+    from rosu_pp_py import Beatmap
+
+    # mtime is part of the key so a re-downloaded file is parsed again
+    return Beatmap(path=path)
+
+
+def calculate_file(path: str, mods: tuple[str, ...]) -> PpResult:
+    """Process pool entry point, parses `path` inside the worker."""
+    return calculate(_parse_file(path, os.stat(path).st_mtime_ns), mods)
+
+
+class DifficultyCache:
+    """LRU of calculation results backed by the `beatmap_attributes` table."""
+
+    def __init__(self, db: Database, size: int) -> None:
+        self.db = db
+        self.size = size
+        self._entries: OrderedDict[
+            tuple[int, tuple[str, ...]], tuple[str, PpResult]
+        ] = OrderedDict()
+
+    async def get(
+        self, beatmap_id: int, mods: tuple[str, ...], checksum: str
+    ) -> PpResult | None:
+        key = (beatmap_id, mods)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == checksum:
+            self._entries.move_to_end(key)
+            return entry[1]
+
+        row = await self.db.fetchrow(
+            """
+            SELECT stars, max_combo, fc_pp, clock_rate FROM beatmap_attributes
+            WHERE beatmap_id = $1 AND mods = $2 AND checksum = $3
+            """,
+            beatmap_id,
+            ",".join(mods),
+            checksum,
+        )
+        if row is None:
+            return None
+        result = PpResult(
+            stars=row["stars"],
+            max_combo=row["max_combo"],
+            pp=row["fc_pp"],
+            clock_rate=row["clock_rate"],
+        )
+        self._remember(key, checksum, result)
+        return result
+
+    async def put(
+        self, beatmap_id: int, mods: tuple[str, ...], checksum: str, result: PpResult
+    ) -> None:
+        self._remember((beatmap_id, mods), checksum, result)
+        await self.db.execute(
+            """
+            INSERT INTO beatmap_attributes
+                (beatmap_id, mods, checksum, stars, max_combo, fc_pp, clock_rate)
+            VALUES ($1, $2, $3, $4, $5, $6, $7)
+            ON CONFLICT (beatmap_id, mods) DO UPDATE SET
+                checksum = EXCLUDED.checksum,
+                stars = EXCLUDED.stars,
+                max_combo = EXCLUDED.max_combo,
+                fc_pp = EXCLUDED.fc_pp,
+                clock_rate = EXCLUDED.clock_rate
+            """,
+            beatmap_id,
+            ",".join(mods),
+            checksum,
+            result.stars,
+            result.max_combo,
+            result.pp,
+            result.clock_rate,
+        )
+
+    def _remember(
+        self, key: tuple[int, tuple[str, ...]], checksum: str, result: PpResult
+    ) -> None:
+        self._entries[key] = (checksum, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+
+class PpCalculator:
+    def __init__(
+        self,
+        beatmaps: BeatmapStore,
+        executor: str,
+        workers: int,
+        cache: DifficultyCache | None = None,
+    ) -> None:
+        if executor not in ("process", "thread"):
+            raise ValueError(f"Unknown pp executor {executor!r}")
+        self.beatmaps = beatmaps
+        self.cache = cache
+        self.use_processes = executor == "process"
+        self._executor: Executor = (
+            # spawn avoids forking a process that has an event loop and threads
+            ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            if self.use_processes
+            else ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pp")
+        )
+
+    async def calculate(
+        self, beatmap_id: int, mods: Iterable[str] = (), checksum: str | None = None
+    ) -> PpResult:
+        """Calculate a beatmap with `mods`, reusing cached results.
+
+        `checksum` is the md5 of the `.osu` file as reported by the osu! API;
+        if given, an outdated local file is downloaded again.
+        """
+        mods = normalize_mods(mods)
+        # keeps the file from being evicted while a worker reads it
+        async with self.beatmaps.use(beatmap_id, checksum) as path:
+            if self.cache is None:
+                return await self._calculate(beatmap_id, path, mods)
+
+            file_checksum = await self.beatmaps.file_checksum(beatmap_id)
+            result = await self.cache.get(beatmap_id, mods, file_checksum)
+            if result is None:
+                result = await self._calculate(beatmap_id, path, mods)
+                await self.cache.put(beatmap_id, mods, file_checksum, result)
+            return result
+
+    async def _calculate(
+        self, beatmap_id: int, path: Path, mods: tuple[str, ...]
+    ) -> PpResult:
+        loop = asyncio.get_running_loop()
+        if self.use_processes:
+            return await loop.run_in_executor(
+                self._executor, calculate_file, str(path), mods
+            )
+        beatmap = await self.beatmaps.get_beatmap(beatmap_id)
+        return await loop.run_in_executor(self._executor, calculate, beatmap, mods)
+
+    async def calculate_many(self, jobs: Iterable[PpJob]) -> list[PpResult]:
+        """Calculate a batch of jobs concurrently, results are in job order."""
+        return await asyncio.gather(
+            *(self.calculate(job.beatmap_id, job.mods) for job in jobs)
+        )
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,117 @@
+"""Startup profiling, enabled with the STARTUP_PROFILE environment variable.
+
+`ImportProfiler` is a `sys.meta_path` finder that wraps module loaders to
+time how long each module takes to import. It has to be installed before
+the modules it should see are imported, so importing this module installs
+it, and `app.py` imports it first. `.env` is loaded here already, like
+`config.py` does, so the flag can be set there too.
+"""
+
+import importlib.abc
+import importlib.machinery
+import os
+import sys
+import time
+from types import ModuleType
+from typing import Any
+
+from dotenv import load_dotenv
+from loguru import logger
+
+# config.py can't be imported yet, it would be missed by the profiler
+load_dotenv(override=True)
+
+STARTUP_PROFILE = (os.getenv("STARTUP_PROFILE") or "").lower() in ("1", "true", "yes")
+
+
+class _TimedLoader(importlib.abc.Loader):
+    """Delegates to the real loader, timing `exec_module`."""
+
+    def __init__(
+        self, loader: importlib.abc.Loader, profiler: "ImportProfiler"
+    ) -> None:
+        self._loader = loader
+        self._profiler = profiler
+
+    def create_module(self, spec: importlib.machinery.ModuleSpec) -> ModuleType | None:
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module: ModuleType) -> None:
+        self._profiler.enter()
+        start = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profiler.leave(module.__name__, time.perf_counter() - start)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._loader, name)
+
+
+class ImportProfiler(importlib.abc.MetaPathFinder):
+    """Records the import time of every module imported after `install`.
+
+    Times are self times: nested imports are subtracted from the module
+    that triggered them.
+    """
+
+    def __init__(self) -> None:
+        # module name -> (self time, total time) in seconds
+        self.timings: dict[str, tuple[float, float]] = {}
+        # time spent in imports not nested in another profiled import
+        self.total = 0.0
+        # time spent in nested imports, per import in progress
+        self._nested: list[float] = []
+
+    def install(self) -> None:
+        sys.meta_path.insert(0, self)
+
+    def uninstall(self) -> None:
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(
+        self,
+        fullname: str,
+        path: Any = None,
+        target: ModuleType | None = None,
+    ) -> importlib.machinery.ModuleSpec | None:
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = _TimedLoader(spec.loader, self)
+        return spec
+
+    def enter(self) -> None:
+        self._nested.append(0.0)
+
+    def leave(self, name: str, total: float) -> None:
+        nested = self._nested.pop()
+        self.timings[name] = (total - nested, total)
+        if self._nested:
+            self._nested[-1] += total
+        else:
+            self.total += total
+
+    def report(self, limit: int = 25) -> None:
+        """Log the slowest imports at INFO."""
+        logger.info(f"imported {len(self.timings)} module(s) in {self.total:.2f}s")
+        slowest = sorted(
+            self.timings.items(), key=lambda item: item[1][0], reverse=True
+        )
+        for name, (self_time, total) in slowest[:limit]:
+            logger.info(
+                f"import {name}: {self_time * 1000:.1f} ms self, {total * 1000:.1f} ms total"
+            )
+
+
+import_profiler: ImportProfiler | None = None
+if STARTUP_PROFILE:
+    import_profiler = ImportProfiler()
+    import_profiler.install()
@@ -0,0 +1,102 @@
+"""Fetching the osu! country performance ranking.
+
+The ranking endpoint pages through 50 players at a time. Page cursors are
+predictable (`Cursor(page=n)`), so the pages are requested concurrently
+under a cap instead of one round trip after another.
+
+The latest ranking is kept as a `RankingSnapshot`. Its entries embed the
+user (name, avatar) and statistics, so ranked players never need a
+separate user lookup.
+"""
+
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from ossapi import Cursor, GameMode, RankingType
+from ossapi.models import UserCompact, UserStatistics
+
+from config import RANKING_FETCH_CONCURRENCY, RANKING_PAGES
+from osu_api import OsuApi, Priority
+from reconcile import build_rank_index
+
+# players per page returned by the rankings endpoint
+RANKING_PAGE_SIZE = 50
+
+
+async def fetch_country_ranking(
+    osuapi: OsuApi,
+    country: str,
+    pages: int = RANKING_PAGES,
+    concurrency: int = RANKING_FETCH_CONCURRENCY,
+    priority: Priority = Priority.DEFAULT,
+) -> list[UserStatistics]:
+    """Fetch the first `pages` pages of a country's performance ranking.
+
+    At most `concurrency` requests are in flight at once. Once a page comes
+    back short, pages after it are no longer requested. Entries are
+    returned in rank order.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    pages_by_number: dict[int, list[UserStatistics]] = {}
+    last_page = pages
+
+    async def fetch_page(page: int) -> None:
+        nonlocal last_page
+        async with semaphore:
+            # a short page was seen while this one was waiting for a slot
+            if page > last_page:
+                return
+            resp = await osuapi.ranking(
+                GameMode.OSU,
+                RankingType.PERFORMANCE,
+                country=country,
+                cursor=Cursor(page=page),
+                priority=priority,
+            )
+        # performance rankings only hold user statistics
+        pages_by_number[page] = [
+            entry for entry in resp.ranking if isinstance(entry, UserStatistics)
+        ]
+        if len(resp.ranking) < RANKING_PAGE_SIZE:
+            last_page = min(last_page, page)
+
+    async with asyncio.TaskGroup() as tg:
+        for page in range(1, pages + 1):
+            tg.create_task(fetch_page(page))
+
+    ranking: list[UserStatistics] = []
+    for page in range(1, last_page + 1):
+        ranking.extend(pages_by_number.get(page, []))
+    return ranking
+
+
+@dataclass(frozen=True, slots=True)
+class RankingEntry:
+    country_rank: int
+    statistics: UserStatistics
+
+    @property
+    def user(self) -> UserCompact:
+        # entries are only built for statistics that have a user
+        assert self.statistics.user is not None
+        return self.statistics.user
+
+
+class RankingSnapshot:
+    """A fetched country ranking indexed by osu! user id."""
+
+    def __init__(self, ranking: list[UserStatistics]) -> None:
+        self.fetched_at = datetime.now(tz=timezone.utc)
+        # osu! id -> country rank
+        self.ranks = build_rank_index(ranking)
+        self.entries = {
+            osu_id: RankingEntry(rank, ranking[rank - 1])
+            for osu_id, rank in self.ranks.items()
+        }
+
+    def get(self, osu_id: int) -> RankingEntry | None:
+        return self.entries.get(osu_id)
+
+    def __len__(self) -> int:
+        return len(self.entries)
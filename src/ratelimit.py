@@ -0,0 +1,71 @@
+"""Async rate limiting primitives."""
+
+import asyncio
+import heapq
+import itertools
+import time
+
+
+class TokenBucket:
+    """Token bucket that refills `rate` tokens every `per` seconds.
+
+    `acquire` waits until a token is available instead of failing. Waiters
+    are served by priority (lower first) and in the order they arrived
+    within a priority. Up to `capacity` tokens can be spent in a burst
+    after an idle period.
+    """
+
+    def __init__(self, rate: float, per: float = 60.0, capacity: float | None = None):
+        if rate <= 0 or per <= 0:
+            raise ValueError("rate and per must be positive")
+        self.fill_rate = rate / per
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        # (priority, arrival, tokens, future) of waiting acquires
+        self._waiters: list[tuple[int, int, float, asyncio.Future[None]]] = []
+        self._arrival = itertools.count()
+        self._timer: asyncio.TimerHandle | None = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.fill_rate
+        )
+        self._updated = now
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, tokens: float = 1, priority: int = 0) -> None:
+        """Wait until `tokens` tokens are available and take them."""
+        future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._arrival), tokens, future))
+        if self._timer is None:
+            self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # granted just before the cancellation, hand the tokens back
+                self._tokens += tokens
+            raise
+
+    def _dispatch(self) -> None:
+        self._timer = None
+        self._refill()
+        while self._waiters:
+            _, _, tokens, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if self._tokens < tokens:
+                delay = (tokens - self._tokens) / self.fill_rate
+                self._timer = asyncio.get_running_loop().call_later(
+                    delay, self._dispatch
+                )
+                return
+            heapq.heappop(self._waiters)
+            self._tokens -= tokens
+            future.set_result(None)
@@ -0,0 +1,180 @@
+"""Rank role reconciliation for `RolesCog`.
+
+`refresh_roles` is split into two stages:
+
+- planning: `plan_role_changes` compares the country ranking snapshot with
+  the rank roles members currently hold and returns only the transitions
+  that need to happen. It is pure and does no I/O.
+- executing: the cog applies the returned transitions with Discord calls.
+
+The index helpers build dictionaries once per run so each linked player
+is resolved with constant-time lookups instead of scanning lists.
+"""
+
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass
+from typing import Protocol, TypeVar
+
+from ossapi.models import User, UserCompact, UserStatistics
+
+from config import ROLE_TRESHOLDS, ROLES_VALUE
+
+# country rank used for players that are not on the fetched ranking pages
+UNRANKED = 99999
+
+# transition kinds, named after the `notikums` values of send_rolechange_msg
+FIRST_ASSIGNMENT = "no_previous_role"
+PROMOTE = "pacelas"
+DEMOTE = "nokritas"
+RESTRICTED = "restricted"
+INACTIVE = "inactive"
+UNRESTRICTED = "unrestricted"
+
+
+class _HasId(Protocol):
+    @property
+    def id(self) -> int: ...
+
+
+T = TypeVar("T", bound=_HasId)
+
+
+@dataclass(frozen=True, slots=True)
+class RoleTransition:
+    """A single rank role change for one linked member."""
+
+    discord_id: int
+    osu_id: int
+    notikums: str
+    new_role: str
+    current_role: str | None
+    # already fetched osu! user, if planning needed one
+    osu_user: UserCompact | None = None
+
+
+def build_rank_index(ranking: Iterable[UserStatistics]) -> dict[int, int]:
+    """Map osu! user id to 1-based country rank for a ranking snapshot.
+
+    If a user appears more than once (pages shifting between requests),
+    the best rank wins.
+    """
+    index: dict[int, int] = {}
+    for rank, entry in enumerate(ranking, start=1):
+        if entry.user is None:
+            continue
+        index.setdefault(entry.user.id, rank)
+    return index
+
+
+def index_by_id(items: Iterable[T]) -> dict[int, T]:
+    """Map discord snowflake to object, e.g. members or roles of a guild."""
+    return {item.id: item for item in items}
+
+
+def role_for_rank(rank: int) -> str:
+    """Return the rank role key for a country rank."""
+    for role, threshold in ROLE_TRESHOLDS.items():
+        if rank <= threshold:
+            return role
+    return "LVinf"
+
+
+def unranked_players(
+    rank_index: Mapping[int, int],
+    players: Iterable[tuple[int, int]],
+    member_roles: Mapping[int, list[str]],
+) -> list[int]:
+    """Return osu ids of linked members missing from the ranking snapshot.
+
+    Their status (restricted, inactive or just below the fetched pages)
+    has to be looked up before planning.
+    """
+    return [
+        osu_id
+        for discord_id, osu_id in players
+        if discord_id in member_roles and osu_id not in rank_index
+    ]
+
+
+def plan_role_changes(
+    rank_index: Mapping[int, int],
+    players: Iterable[tuple[int, int]],
+    member_roles: Mapping[int, list[str]],
+    unranked_users: Mapping[int, User | None],
+) -> list[RoleTransition]:
+    """Compute the rank role transitions needed to match the ranking.
+
+    - `players` are (discord_id, osu_id) pairs of linked players.
+    - `member_roles` maps discord id of every guild member to the rank role
+      keys they currently hold; players not in it have left the guild.
+    - `unranked_users` maps osu id of unranked players to their looked up
+      user, or None if the lookup failed (restricted). Unranked players
+      missing from it are skipped.
+    """
+    plan: list[RoleTransition] = []
+    for discord_id, osu_id in players:
+        roles = member_roles.get(discord_id)
+        if roles is None:
+            continue
+        current = roles[0] if roles else None
+        rank = rank_index.get(osu_id, UNRANKED)
+        osu_user: User | None = None
+
+        if rank == UNRANKED:
+            if osu_id not in unranked_users:
+                continue
+            osu_user = unranked_users[osu_id]
+            if osu_user is None:
+                if current != "restricted":
+                    plan.append(
+                        RoleTransition(
+                            discord_id, osu_id, RESTRICTED, "restricted", current
+                        )
+                    )
+                continue
+            if not getattr(osu_user.statistics, "is_ranked", True):
+                if current != "inactive":
+                    plan.append(
+                        RoleTransition(
+                            discord_id, osu_id, INACTIVE, "inactive", current, osu_user
+                        )
+                    )
+                continue
+
+        new_role = role_for_rank(rank)
+        if current is None:
+            notikums = FIRST_ASSIGNMENT
+        elif current == "restricted":
+            notikums = UNRESTRICTED
+        elif ROLES_VALUE[new_role] < ROLES_VALUE[current]:
+            notikums = PROMOTE
+        elif ROLES_VALUE[new_role] > ROLES_VALUE[current]:
+            notikums = DEMOTE
+        else:
+            continue
+        plan.append(
+            RoleTransition(discord_id, osu_id, notikums, new_role, current, osu_user)
+        )
+    return plan
+
+
+def describe_plan(plan: list[RoleTransition], limit: int = 25) -> str:
+    """Render a plan as a short human readable report."""
+    if not plan:
+        return "No role changes needed."
+    counts: dict[str, int] = {}
+    for transition in plan:
+        counts[transition.notikums] = counts.get(transition.notikums, 0) + 1
+    lines = [
+        f"{len(plan)} role change(s): "
+        + ", ".join(f"{kind} {count}" for kind, count in counts.items())
+    ]
+    for transition in plan[:limit]:
+        lines.append(
+            f"<@{transition.discord_id}> (osu! {transition.osu_id}): "
+            f"{transition.current_role or '-'} -> {transition.new_role} "
+            f"({transition.notikums})"
+        )
+    if len(plan) > limit:
+        lines.append(f"... and {len(plan) - limit} more")
+    return "\n".join(lines)
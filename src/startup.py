@@ -0,0 +1,66 @@
+"""Startup steps run by `OsuBot.on_ready`.
+
+`on_ready` fires again after every reconnect, `StartupSteps` makes sure
+the startup work only runs once per process. Each step is timed and its
+failure is logged without stopping the other steps.
+"""
+
+import hashlib
+import json
+import time
+from collections.abc import Awaitable
+
+import discord
+from discord import app_commands
+from loguru import logger
+
+
+def command_tree_fingerprint(
+    tree: app_commands.CommandTree, guild: discord.abc.Snowflake
+) -> str:
+    """Hash of the guild command payloads `tree.sync(guild=guild)` would send.
+
+    Commands are sorted and serialized with sorted keys, so the hash only
+    changes when the commands themselves change.
+    """
+    payloads = sorted(
+        (command.to_dict(tree) for command in tree.get_commands(guild=guild)),
+        key=lambda payload: (payload.get("type", 1), payload["name"]),
+    )
+    encoded = json.dumps(payloads, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+class StartupSteps:
+    def __init__(self) -> None:
+        self.started = False
+        # step name -> duration in seconds
+        self.durations: dict[str, float] = {}
+        self._start = time.perf_counter()
+
+    def begin(self) -> bool:
+        """Return True the first time only."""
+        if self.started:
+            return False
+        self.started = True
+        self._start = time.perf_counter()
+        return True
+
+    async def run(self, name: str, step: Awaitable[object]) -> bool:
+        """Await a step, log its duration, returns whether it succeeded."""
+        start = time.perf_counter()
+        try:
+            await step
+            return True
+        except Exception:
+            logger.exception(f"startup step {name} failed")
+            return False
+        finally:
+            self.durations[name] = time.perf_counter() - start
+            logger.info(f"startup step {name} took {self.durations[name]:.2f}s")
+
+    def summary(self) -> str:
+        steps = ", ".join(
+            f"{name} {took:.2f}s" for name, took in self.durations.items()
+        )
+        return f"startup finished in {time.perf_counter() - self._start:.2f}s ({steps})"
@@ -1,10 +1,11 @@
-from config import ROLE_TRESHOLDS, BOTSPAM_CHANNEL_ID, ROLES
+from config import BOTSPAM_CHANNEL_ID, REV_ROLES, ROLES
 import discord
 from discord.ext import commands
 from loguru import logger
 from app import OsuBot
+from reconcile import role_for_rank
 from ossapi import GameMode, UserLookupKey
-from ossapi.models import User
+from ossapi.models import UserCompact
 import asyncio
 
 # Admin role ID that can use admin commands
@@ -63,63 +64,58 @@ class BaseCog(commands.Cog):
 
 # seperate function to check just one user and update their role on the server
 async def refresh_user_rank(member: discord.Member, bot: OsuBot) -> None:
-    async with bot.db.pool.acquire() as db:
-        query = await db.fetch(
-            f"SELECT discord_id, osu_id FROM players WHERE osu_id IS NOT NULL AND discord_id = {member.id};"
-        )
-        if query != []:
-            osu_user = await bot.osuapi.user(
-                query[0][1], mode=GameMode.OSU, key=UserLookupKey.ID
-            )
-            new_role = await get_role_with_rank(
-                getattr(osu_user.statistics, "country_rank", 99999)
-            )
-            current_role = [
-                role.id for role in member.roles if role.id in ROLES.values()
-            ]
-            if current_role == []:
-                await change_role(
-                    bot=bot, discord_id=member.id, new_role_id=ROLES[new_role]
-                )
-            else:
-                await change_role(
-                    bot=bot,
-                    discord_id=member.id,
-                    new_role_id=ROLES[new_role],
-                    current_role_id=current_role[0],
-                )
-            await send_rolechange_msg(
-                bot=bot,
-                discord_id=member.id,
-                notikums="no_previous_role",
-                role=new_role,
-                osu_user=osu_user,
+    player = bot.players.get(member.id)
+    if player is not None and player.osu_id is not None:
+        # players on the last fetched ranking need no lookup
+        entry = bot.ranking.get(player.osu_id) if bot.ranking is not None else None
+        osu_user: UserCompact
+        if entry is not None:
+            osu_user = entry.user
+            country_rank = entry.country_rank
+        else:
+            user = await bot.osuapi.user(
+                player.osu_id, mode=GameMode.OSU, key=UserLookupKey.ID
             )
-            logger.info(f"refreshed rank for user {member.display_name}")
+            osu_user = user
+            country_rank = getattr(user.statistics, "country_rank", 99999)
+        new_role = await get_role_with_rank(country_rank)
+        await change_role(bot=bot, discord_id=member.id, new_role_id=ROLES[new_role])
+        await send_rolechange_msg(
+            bot=bot,
+            discord_id=member.id,
+            notikums="no_previous_role",
+            role=new_role,
+            osu_user=osu_user,
+        )
+        logger.info(f"refreshed rank for user {member.display_name}")
 
 
 async def get_role_with_rank(rank: int) -> str:
-    for role, threshold in ROLE_TRESHOLDS.items():
-        if rank <= threshold:
-            return role
-    return "LVinf"
+    return role_for_rank(rank)
 
 
-async def change_role(
-    bot: OsuBot, discord_id: int, new_role_id: int, current_role_id: int = 0
-) -> None:
-    member = discord.utils.get(bot.lvguild.members, id=discord_id)
+async def change_role(bot: OsuBot, discord_id: int, new_role_id: int) -> None:
+    """Replace all rank roles of a member with `new_role_id`.
+
+    The final role set is applied with a single `member.edit` request, so
+    the member is never left without a rank role and any stale rank roles
+    are dropped at the same time.
+    """
+    # Guild.get_member/get_role are backed by dicts, unlike utils.get over lists
+    member = bot.lvguild.get_member(discord_id)
     if member is None:
         raise ValueError(f"Member {discord_id} not found in guild")
-    if current_role_id != 0:
-        current_role = discord.utils.get(bot.lvguild.roles, id=current_role_id)
-        if current_role is None:
-            raise ValueError(f"Role {current_role_id} not found in guild")
-        await member.remove_roles(current_role)
-    new_role = discord.utils.get(bot.lvguild.roles, id=new_role_id)
+    new_role = bot.lvguild.get_role(new_role_id)
     if new_role is None:
         raise ValueError(f"Role {new_role_id} not found in guild")
-    await member.add_roles(new_role)
+
+    # member.roles[0] is @everyone, which must not be sent back to the API
+    current_roles = member.roles[1:]
+    roles = [role for role in current_roles if role.id not in REV_ROLES]
+    roles.append(new_role)
+    if {role.id for role in roles} == {role.id for role in current_roles}:
+        return
+    await member.edit(roles=roles)
 
 
 async def update_users_in_database(bot: OsuBot) -> list[discord.Member]:
@@ -128,27 +124,24 @@ async def update_users_in_database(bot: OsuBot) -> list[discord.Member]:
     Returns:
         list[discord.Member]: List of members that were added to the database
     """
-    async with bot.db.pool.acquire() as db:
-        result = await db.fetch("SELECT discord_id FROM players;")
-        db_id_list = [x[0] for x in result]
-        added_members: list[discord.Member] = []
-
-        for member in bot.lvguild.members:
-            if member.id not in db_id_list:
-                await db.execute(
-                    f"INSERT INTO players (discord_id) VALUES ({member.id});"
-                )
-                logger.warning(
-                    f"update_user: User {member.name} (ID: {member.id}) was not in database and has been added"
-                )
-                added_members.append(member)
+    members = {member.id: member for member in bot.lvguild.members}
+    missing = members.keys() - bot.players.discord_ids()
+    added_ids = await bot.players.add_many(missing)
+
+    added_members: list[discord.Member] = []
+    for discord_id in added_ids:
+        member = members[discord_id]
+        logger.warning(
+            f"update_user: User {member.name} (ID: {member.id}) was not in database and has been added"
+        )
+        added_members.append(member)
 
-        if added_members:
-            logger.info(f"update_user: Added {len(added_members)} user(s) to database")
-        else:
-            logger.info("update_user: No new users to add to database")
+    if added_members:
+        logger.info(f"update_user: Added {len(added_members)} user(s) to database")
+    else:
+        logger.info("update_user: No new users to add to database")
 
-        return added_members
+    return added_members
 
 
 async def send_rolechange_msg(
@@ -157,14 +150,13 @@ async def send_rolechange_msg(
     discord_id: int,
     role: str | None = None,
     osu_id: int | None = None,
-    osu_user: User | None = None,
+    osu_user: UserCompact | None = None,
 ) -> None:
-    channel = bot.get_channel(BOTSPAM_CHANNEL_ID)
     # member = discord.utils.get(bot.lvguild.members, id=discord_id)
 
     # Helper function to get role name
     def get_role_name(role_key: str) -> str:
-        role_obj = discord.utils.get(bot.lvguild.roles, id=ROLES[role_key])
+        role_obj = bot.lvguild.get_role(ROLES[role_key])
         return role_obj.name if role_obj else role_key
 
     match notikums:
@@ -211,8 +203,4 @@ async def send_rolechange_msg(
         icon_url=osu_user.avatar_url,
     )
 
-    if not channel or not isinstance(channel, discord.TextChannel):
-        raise ValueError(
-            f"Channel {BOTSPAM_CHANNEL_ID} not found or is not a text channel"
-        )
-    await channel.send(embed=embed)
+    await bot.dispatcher.send(BOTSPAM_CHANNEL_ID, embed=embed)